@@ -2,7 +2,9 @@
 
 from flask import Flask
 
-from owntube.views import channel, video
+from owntube.utils.commonutils import db_release
+from owntube.views import channel, download, image, metrics, status, \
+    sync, video
 
 # Define the global flask application object.
 app = Flask(__name__)
@@ -12,9 +14,17 @@ app.static_url_path = ''
 app.static_folder = app.root_path + '/owntube/static'
 app.template_folder = app.root_path + '/owntube/templates'
 
+# Return database connections to the pool at the end of each request.
+app.teardown_appcontext(db_release)
+
 # Register blueprints.
 app.register_blueprint(channel.bp)
 app.register_blueprint(video.bp)
+app.register_blueprint(status.bp)
+app.register_blueprint(download.bp)
+app.register_blueprint(image.bp)
+app.register_blueprint(metrics.bp)
+app.register_blueprint(sync.bp)
 
 if __name__ == '__main__':
     app.run()
@@ -1,19 +1,19 @@
 #!/usr/bin/env python3
 
 import datetime
-import json
 
-from os.path import abspath, dirname
+from sty import fg
 
-import requests
-from requests.exceptions import HTTPError
-
-from lxml import etree
-from sty import fg, ef
-
-from owntube.utils.commonutils import download_image, read_config
+from owntube.utils.commonutils import batched, read_config
+from owntube.utils.dumpreader import DumpReader
+from owntube.utils.fetcher import FetchEngine
+from owntube.utils.pagination import default_count, encode_cursor
+from owntube.utils.queries import Template
 from owntube.utils.database import DatabaseItem
 from owntube.utils.renderable import Renderable
+from owntube.enrichment import MetadataQueue
+from owntube.images import ImagePipeline, best_thumbnail
+from owntube.timeline import Timeline
 from owntube.exceptions import ChannelNotFound, SubscriptionFeedFetchError
 import owntube.video as video
 
@@ -31,20 +31,95 @@ class YouTubeRSS:
     def __init__(self, channel_id):
         self.channel_id = channel_id
 
+    @property
+    def url(self):
+        """URL of the channel's feed."""
+        return self.CHANNEL_RSS_BASE_URL + self.channel_id
+
     def fetch(self):
         """Fetches the RSS feed of the channel."""
-        req = requests.get(self.CHANNEL_RSS_BASE_URL + self.channel_id)
+        req = FetchEngine.shared().fetch(self.url)
         if req.status_code != 200:
             raise SubscriptionFeedFetchError()
 
-        return etree.fromstring(bytes(req.text, encoding='utf-8'))
+        # Only the feed readers need the XML parser, so it's loaded here.
+        from lxml import etree
+        return etree.fromstring(req.content)
+
+    def fetch_if_modified(self, etag = None, last_modified = None,
+                          timeout = None):
+        """Fetches the raw feed only if it changed since the last time. Returns
+        the feed (None if unchanged) and the new validators."""
+        req = FetchEngine.shared().fetch(
+            self.url, self.conditional_headers(etag, last_modified), timeout)
+        return self.read_if_modified(req, etag, last_modified)
+
+    @staticmethod
+    def conditional_headers(etag, last_modified):
+        """Headers that ask for the feed only if it changed."""
+        headers = {}
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        if last_modified is not None:
+            headers['If-Modified-Since'] = last_modified
+
+        return headers
+
+    def read_if_modified(self, req, etag, last_modified):
+        """Gets the raw feed and new validators out of the response to a
+        conditional request."""
+        if req.status_code == 304:
+            return None, etag, last_modified
+        if req.status_code != 200:
+            raise SubscriptionFeedFetchError(
+                f'Failed to fetch the feed of {self.channel_id} '
+                f'(HTTP {req.status_code})')
+
+        return req.content, req.headers.get('ETag'), \
+            req.headers.get('Last-Modified')
+
+    @classmethod
+    def parse(cls, xml):
+        """Parses the entries of a raw feed, newest first."""
+        # Only the feed readers need the XML parser, so it's loaded here.
+        from lxml import etree
+        root = etree.fromstring(xml)
+        entries = []
+        for entry in root.iter(f'{cls.NS_ATOM}entry'):
+            group = entry.find(f'{cls.NS_MEDIA}group')
+            thumb = group.find(f'{cls.NS_MEDIA}thumbnail')
+            entries.append({
+                'video_id': entry.findtext(f'{cls.NS_YOUTUBE}videoId'),
+                'title': entry.findtext(f'{cls.NS_ATOM}title'),
+                'description': group.findtext(f'{cls.NS_MEDIA}description'),
+                'published': datetime.datetime.fromisoformat(
+                    entry.findtext(f'{cls.NS_ATOM}published')),
+                'thumbnails': {} if thumb is None else {
+                    'default': {
+                        'url': thumb.get('url'),
+                        'width': int(thumb.get('width')),
+                        'height': int(thumb.get('height'))
+                    }
+                }
+            })
+
+        return entries
 
 class Channel(DatabaseItem, Renderable):
     """Representation of an YouTube channel."""
 
-    def __init__(self, channel_id = None, name = None, description = None):
-        super().__init__('channels')
+    __slots__ = ('channel_id', 'name', 'description')
+
+    TABLE = 'channels'
+    COLUMNS = ('cid', 'name', 'description')
+
+    # Listing of the channels.
+    _LISTING = Template('ChannelRow',
+                        f'SELECT {", ".join(COLUMNS)} FROM channels '
+                        '{where}ORDER BY cid {limit}', COLUMNS,
+                        { 'after': 'cid > %s' })
 
+    def __init__(self, channel_id = None, name = None, description = None):
         self.channel_id = channel_id
         self.name = name
         self.description = description
@@ -58,6 +133,16 @@ class Channel(DatabaseItem, Renderable):
 
         return d
 
+    @staticmethod
+    def dict_from_row(row, expand = None):
+        """Builds the same dictionary as __dict__ straight from a row, without
+        the cost of building the object."""
+        return {
+            'id': row[0],
+            'name': row[1],
+            'description': row[2]
+        }
+
     def from_id(self, id):
         # Fetch database row.
         row = self._fetch_by_id('cid', id)
@@ -67,103 +152,155 @@ class Channel(DatabaseItem, Renderable):
         return self._from_row(row)
 
     def save(self):
-        self._commit({
+        self._commit(self._params())
+
+    def delete(self):
+        """Deletes the channel along with its videos and their downloads."""
+        self._remove(self.channel_id, (
+            ('downloaded_videos', 'SELECT downloaded_videos.id '
+                'FROM downloaded_videos INNER JOIN videos '
+                'ON videos.vid = downloaded_videos.vid '
+                'WHERE videos.channel_cid = %s'),
+            ('videos', 'SELECT vid FROM videos WHERE channel_cid = %s')))
+
+    @classmethod
+    def _saving(cls, cur, rows):
+        # The home feed has the names of the channels in it.
+        Timeline().refresh_channels(cur, [row['cid'] for row in rows])
+
+    def _params(self):
+        return {
             'cid': self.channel_id,
             'name': self.name,
             'description': self.description
-        })
+        }
 
     def exists(self):
         return self._check_exists('cid', self.channel_id)
 
-    def list(self):
-        """Gets a list of the channels in the database."""
-        channels = []
+    def list(self, count=None, after=None):
+        """Gets a list of the channels in the database. The after argument is
+        the sort key of the last channel of the previous page."""
+        return list(self.iter(count, after))
 
-        # Get all the channels.
-        with self.conn.cursor() as cur:
-            cur.execute('SELECT * FROM channels')
-            for row in cur.fetchall():
-                channels.append(Channel()._from_row(row))
+    def iter(self, count=None, after=None):
+        """Iterates over the channels straight from the database cursor."""
+        for row in self._query(self._listing(count, after)):
+            yield Channel()._from_row(row)
 
-        return channels
+    def iter_dicts(self, count=None, after=None):
+        """Iterates over the channels as dictionaries for read-only listings."""
+        for row in self._query(self._listing(count, after)):
+            yield self.dict_from_row(row)
 
-    def videos(self, count=None, since=None):
-        """Gets the lastest videos or all the videos since a date."""
-        videos = []
+    @property
+    def cursor(self):
+        """Page token that continues a listing right after this channel."""
+        return encode_cursor(self.channel_id)
 
-        # Ensure the user gets something.
-        if count is None and since is None:
-            count = read_config()['settings']['video_count']
+    @staticmethod
+    def dict_cursor(d):
+        """Page token that continues a listing right after a channel
+        dictionary."""
+        return encode_cursor(d['id'])
 
-        # Build up statement depending on our constraints.
-        stmt = 'SELECT * FROM videos WHERE channel_cid = ? '
-        if since is not None:
-            stmt += 'AND published_date >= ? '
-        stmt += 'ORDER BY published_date DESC '
-        if count is not None:
-            stmt += 'LIMIT ? '
+    def _listing(self, count, after):
+        """Builds the query of a listing of channels."""
+        return self._LISTING.bind(
+            { 'after': None if after is None else [after[0]] }, count)
 
-        with self.conn.cursor() as cur:
-            # Setup our statement parameters.
-            params = [ self.channel_id ]
-            if since is not None:
-                params.append(since.strftime('%Y-%m-%d %H:%M:%S'))
-            if count is not None:
-                params.append(count)
+    def videos(self, count=None, since=None, after=None):
+        """Gets the lastest videos or all the videos since a date."""
+        return list(self.iter_videos(default_count(count, since), since, after))
 
-            # Get our videos.
-            cur.execute(stmt, params)
-            for row in cur.fetchall():
-                videos.append(video.Video()._from_row(row, chan=self))
+    def iter_videos(self, count=None, since=None, after=None):
+        """Iterates over the videos of the channel straight from the database
+        cursor."""
+        return video.Video().iter(count, since, after, chan=self)
 
-        return videos
+    def iter_video_dicts(self, count=None, since=None, after=None):
+        """Iterates over the videos of the channel as dictionaries for
+        read-only listings."""
+        return video.Video().iter_dicts(count, since, after, chan=self)
 
-    @property
-    def avatar_dir(self):
-        """Location of the channel avatar directory."""
-        return dirname(abspath(__file__)) + '/static/avatars'
+    def video_ids(self):
+        """Gets the IDs of all the videos of the channel in the database."""
+        with self.conn.cursor() as cur:
+            cur.execute('SELECT vid FROM videos WHERE channel_cid = %s',
+                        [self.channel_id])
+            return set(row[0] for row in cur.fetchall())
 
     @staticmethod
-    def import_from_dump(fname):
-        """Imports data from a JSON dump and saves it to the database."""
-        # Load the JSON dump.
-        with open(fname, 'r') as fh:
-            channel = json.load(fh)
-
-        # Build up the new class and save it to the database.
-        self = Channel(channel['resourceId']['channelId'], channel['title'],
-                       channel['description'])
-        print(f'Importing channel {fg.yellow}{self.name}{fg.rs}...')
-
-        # Save the channel to the database.
-        self.save()
-
-        # Download the thumbnail.
-        self._fetch_avatar(channel['thumbnails'])
-
-        # Go through the videos and import them.
-        if channel['videos'] is None:
-            return self
-        total = len(channel['videos'])
-        index = 1
-        for video_dump in channel['videos']:
-            print(f'[{fg.blue}{index}/{total}{fg.rs}] Importing video '
-                  f'{ef.italic}{video_dump["title"]}{ef.rs}')
-            video.Video.import_from_dump(self, video_dump)
-            index += 1
+    def import_from_dump(fname, images = None, stats = None):
+        """Imports data from a JSON dump and saves it to the database, skipping
+        videos that are already in there. Images are downloaded using the
+        images pipeline if one is provided."""
+        if images is None:
+            images = ImagePipeline.shared()
+
+        # Videos are streamed from the dump rather than loaded all at once.
+        with DumpReader(fname) as dump:
+            # Build up the new class and save it to the database.
+            self = Channel(dump.channel['resourceId']['channelId'],
+                           dump.channel['title'],
+                           dump.channel['description'])
+            print(f'Importing channel {fg.yellow}{self.name}{fg.rs}...')
+            self.save()
+
+            # Download the avatar.
+            pending = images.submit('avatars', [
+                (self.channel_id, dump.channel['thumbnails']['high']['url'])])
+            nimages = 1
+            nbytes = 0
+
+            # Import the videos that we don't have yet in batches.
+            imported = 0
+            skipped = 0
+            batch_size = read_config()['settings'].get('batch_size', 500)
+            for batch in batched(dump.videos, batch_size):
+                new = set(video.Video.diff_new(
+                    [video_dump['resourceId']['videoId']
+                     for video_dump in batch]))
+                dumps = [video_dump for video_dump in batch
+                         if video_dump['resourceId']['videoId'] in new]
+                skipped += len(batch) - len(dumps)
+                imported += len(dumps)
+
+                # Keep at most two batches worth of thumbnails in flight.
+                futures = self._import_videos(dumps, images)
+                nimages += len(futures)
+                nbytes += images.collect(pending)
+                pending = futures
+
+            nbytes += images.collect(pending)
+
+        print(f'Imported {fg.blue}{imported}{fg.rs} new videos from '
+              f'{fg.yellow}{self.name}{fg.rs} ({skipped} already known)')
+        if stats is not None:
+            stats.add(videos=imported, skipped=skipped, images=nimages,
+                      nbytes=nbytes)
 
         return self
 
+    def _import_videos(self, dumps, images):
+        """Saves a batch of videos from a dump and queues up their thumbnails
+        for download."""
+        videos = [video.Video.from_dump(self, video_dump)
+                  for video_dump in dumps]
+        video.Video.save_many(videos)
+
+        # Leave the extra metadata for the enrichment workers to fetch.
+        MetadataQueue().enqueue([vid.video_id for vid in videos
+                                 if vid.height is None])
+
+        return images.submit('thumbnails', [
+            (vid.video_id, best_thumbnail(video_dump['thumbnails']))
+            for vid, video_dump in zip(videos, dumps)])
+
     def _fetch_avatar(self, thumbs):
         """Downloads the channel's avatar from the thumbnails list."""
-        url = thumbs['high']['url']
-
-        try:
-            download_image(url, f'{self.avatar_dir}/{self.channel_id}.jpg')
-        except HTTPError as err:
-            print(f'{fg.red}Error: Failed to fetch avatar from {url}\n'
-                  f'{err}{fg.rs}')
+        return ImagePipeline.shared().fetch('avatars', self.channel_id,
+                                            thumbs['high']['url'])
 
     def _from_row(self, row):
         self.channel_id = row[0]
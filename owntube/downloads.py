@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""Persistent queue of video downloads and the workers that process it."""
+
+import threading
+import time
+
+from sty import fg
+
+from owntube.utils.commonutils import db_connect, db_dialect, db_release, \
+    read_config
+from owntube.utils.loggers import ConsoleLogger
+from owntube.exceptions import DownloadJobNotFound
+import owntube.video as video
+
+class DownloadQueue:
+    """Table-backed queue of download jobs."""
+
+    # Columns of a job in the order they are selected.
+    COLUMNS = ('id', 'vid', 'height', 'state', 'attempts', 'next_attempt',
+               'downloaded_bytes', 'total_bytes', 'speed', 'error',
+               'created_at', 'updated_at')
+
+    # Number of times we'll try to download a video.
+    MAX_ATTEMPTS = 5
+
+    # Range of heights (in pixels) that videos can be downloaded in.
+    MIN_HEIGHT = 144
+    MAX_HEIGHT = 4320
+
+    def __init__(self):
+        self.conn = db_connect()
+        self.dialect = db_dialect()
+
+    def enqueue(self, vid, height):
+        """Queues up the download of a video unless we already have it. Failed
+        jobs are given a fresh start."""
+        with self.conn.cursor() as cur:
+            # Check if it was already downloaded outside of the queue.
+            cur.execute('SELECT EXISTS(SELECT id FROM downloaded_videos '
+                        'WHERE vid = %s AND height = %s)', [vid, height])
+            if cur.fetchone()[0] == 1:
+                cur.execute('INSERT INTO download_jobs(vid, height, state) '
+                            "VALUES (%s, %s, 'done') " +
+                            self.dialect.on_duplicate(["state = 'done'"]),
+                            [vid, height])
+            else:
+                # The state is assigned last since MySQL applies the
+                # assignments in order.
+                failed = "CASE WHEN state = 'failed' THEN {} ELSE {} END"
+                cur.execute('INSERT INTO download_jobs(vid, height) '
+                            'VALUES (%s, %s) ' + self.dialect.on_duplicate([
+                                'attempts = ' +
+                                failed.format('0', 'attempts'),
+                                'next_attempt = ' +
+                                failed.format(self.dialect.NOW,
+                                              'next_attempt'),
+                                'state = ' +
+                                failed.format("'queued'", 'state')]),
+                            [vid, height])
+
+        return self.find(vid, height)
+
+    def claim(self):
+        """Atomically takes the next job that is due from the queue."""
+        with self.conn.cursor() as cur:
+            if self.dialect.UPDATE_RETURNING:
+                cur.execute("UPDATE download_jobs SET state = 'running', "
+                            'attempts = attempts + 1 WHERE id = ('
+                            "SELECT id FROM download_jobs WHERE state = "
+                            f"'queued' AND next_attempt <= {self.dialect.NOW} "
+                            'ORDER BY next_attempt, id LIMIT 1) RETURNING id')
+                row = cur.fetchone()
+                return None if row is None else self.get(row[0])
+
+            cur.execute("UPDATE download_jobs SET state = 'running', "
+                        'attempts = attempts + 1, id = LAST_INSERT_ID(id) '
+                        "WHERE state = 'queued' AND next_attempt <= NOW() "
+                        'ORDER BY next_attempt, id LIMIT 1')
+            if cur.rowcount == 0:
+                return None
+
+            return self.get(cur.lastrowid)
+
+    def recover(self, stale = 300):
+        """Puts back jobs whose workers haven't sent a heartbeat in a while."""
+        with self.conn.cursor() as cur:
+            cur.execute("UPDATE download_jobs SET state = 'queued' "
+                        "WHERE state = 'running' AND "
+                        f'updated_at < {self.dialect.SECONDS_FROM_NOW}',
+                        [-stale])
+
+    def progress(self, id, downloaded, total, speed):
+        """Records the progress of a running job, which also counts as a
+        heartbeat."""
+        with self.conn.cursor() as cur:
+            cur.execute('UPDATE download_jobs SET downloaded_bytes = %s, '
+                        'total_bytes = %s, speed = %s, '
+                        f'updated_at = {self.dialect.NOW} WHERE id = %s',
+                        [downloaded, total, speed, id])
+
+    def heartbeat(self, id):
+        """Lets the others know that the worker of a job is still alive."""
+        with self.conn.cursor() as cur:
+            cur.execute('UPDATE download_jobs SET '
+                        f'updated_at = {self.dialect.NOW} WHERE id = %s', [id])
+
+    def done(self, id):
+        """Marks a job as done."""
+        with self.conn.cursor() as cur:
+            cur.execute("UPDATE download_jobs SET state = 'done', "
+                        'error = NULL WHERE id = %s', [id])
+
+    def failed(self, job, error, backoff = 60):
+        """Schedules a failed job to be retried with an exponential backoff or
+        gives up on it after too many attempts."""
+        with self.conn.cursor() as cur:
+            if job['attempts'] >= self.MAX_ATTEMPTS:
+                cur.execute("UPDATE download_jobs SET state = 'failed', "
+                            'error = %s WHERE id = %s', [str(error), job['id']])
+            else:
+                cur.execute("UPDATE download_jobs SET state = 'queued', "
+                            'error = %s, next_attempt = '
+                            f'{self.dialect.SECONDS_FROM_NOW} WHERE id = %s',
+                            [str(error), backoff * 2 ** (job['attempts'] - 1),
+                             job['id']])
+
+    def get(self, id):
+        """Gets a job via its ID."""
+        jobs = self._select('WHERE id = %s', [id])
+        if len(jobs) == 0:
+            raise DownloadJobNotFound()
+
+        return jobs[0]
+
+    def find(self, vid, height):
+        """Gets the job of a video in a specific resolution."""
+        jobs = self._select('WHERE vid = %s AND height = %s', [vid, height])
+        if len(jobs) == 0:
+            raise DownloadJobNotFound()
+
+        return jobs[0]
+
+    def list(self, state = None, count = 100):
+        """Gets the latest jobs, optionally only the ones in a given state."""
+        if state is not None:
+            return self._select('WHERE state = %s ORDER BY id DESC LIMIT %s',
+                                [state, count])
+
+        return self._select('ORDER BY id DESC LIMIT %s', [count])
+
+    def _select(self, clauses, params):
+        """Gets jobs as dictionaries."""
+        with self.conn.cursor() as cur:
+            cur.execute(f'SELECT {", ".join(self.COLUMNS)} FROM download_jobs '
+                        f'{clauses}', params)
+            return [dict(zip(self.COLUMNS, row)) for row in cur.fetchall()]
+
+class DownloadWorker:
+    """Pool of threads that download the videos in the queue."""
+
+    # Minimum number of seconds between progress reports of a job.
+    PROGRESS_INTERVAL = 2
+
+    # Number of seconds between the checks for jobs of dead workers.
+    RECOVER_INTERVAL = 60
+
+    def __init__(self, workers = None, ratelimit = None,
+                 logger = ConsoleLogger()):
+        settings = read_config()['settings']
+        self.workers = workers or settings.get('download_workers', 2)
+        self.stale = settings.get('download_stale', 300)
+        self.logger = logger
+
+        # Share the bandwidth cap between the workers.
+        ratelimit = ratelimit or settings.get('download_ratelimit')
+        self.ratelimit = None if ratelimit is None else \
+            max(1, ratelimit // self.workers)
+
+    def run(self, watch = None):
+        """Works through the queue until it's empty or forever if watching."""
+        threads = [threading.Thread(target=self._work, args=(watch,))
+                   for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _work(self, watch):
+        """Processes jobs from the queue."""
+        try:
+            queue = DownloadQueue()
+            last_recover = None
+            while True:
+                # Put back the jobs of workers that died along the way.
+                if last_recover is None or \
+                        time.monotonic() - last_recover > self.RECOVER_INTERVAL:
+                    last_recover = time.monotonic()
+                    queue.recover(self.stale)
+
+                job = queue.claim()
+                if job is None:
+                    if watch is None:
+                        return
+
+                    time.sleep(watch)
+                    continue
+
+                self._download(queue, job)
+        finally:
+            db_release()
+
+    def _download(self, queue, job):
+        """Downloads the video of a job."""
+        print(f'Downloading {fg.yellow}{job["vid"]}{fg.rs} at '
+              f'{job["height"]}p (attempt {job["attempts"]})')
+
+        # Report the progress of the download every now and then, which also
+        # keeps the job from being taken as abandoned while post-processing.
+        last_report = 0
+        def progress(data):
+            nonlocal last_report
+            if time.monotonic() - last_report <= self.PROGRESS_INTERVAL:
+                return
+
+            last_report = time.monotonic()
+            if data['status'] != 'downloading':
+                queue.heartbeat(job['id'])
+                return
+
+            speed = data.get('speed')
+            queue.progress(job['id'], data.get('downloaded_bytes'),
+                           data.get('total_bytes') or
+                           data.get('total_bytes_estimate'),
+                           None if speed is None else int(speed))
+
+        try:
+            video.Video().from_id(job['vid']).download(
+                job['height'], self.logger, self.ratelimit, progress)
+            queue.done(job['id'])
+        except Exception as err:
+            queue.failed(job, err)
+            print(f'{fg.red}Error: Failed to download {job["vid"]}\n'
+                  f'{err}{fg.rs}')
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Background enrichment of videos that are missing their extra metadata."""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sty import fg
+
+from owntube.utils.commonutils import db_connect, db_dialect, read_config
+from owntube.utils.loggers import ConsoleLogger
+from owntube.exceptions import VideoNotFound
+import owntube.video as video
+
+class MetadataQueue:
+    """Persistent queue of videos waiting for their metadata to be fetched."""
+
+    # Number of times we'll try to fetch the metadata of a video.
+    MAX_ATTEMPTS = 5
+
+    def __init__(self):
+        self.conn = db_connect()
+
+    def enqueue(self, vids):
+        """Places videos in the queue if they aren't there already."""
+        if len(vids) == 0:
+            return
+
+        with self.conn.cursor() as cur:
+            cur.executemany(f'{db_dialect().INSERT_IGNORE} INTO '
+                            'metadata_queue(vid) VALUES (%s)',
+                            [(vid,) for vid in vids])
+
+    def seed(self):
+        """Queues up every video in the database that is missing metadata."""
+        with self.conn.cursor() as cur:
+            cur.execute(f'{db_dialect().INSERT_IGNORE} INTO '
+                        'metadata_queue(vid) '
+                        'SELECT vid FROM videos WHERE height IS NULL')
+
+    def next_batch(self, size):
+        """Gets the IDs of the next videos that should be enriched."""
+        with self.conn.cursor() as cur:
+            cur.execute('SELECT vid FROM metadata_queue WHERE attempts < %s '
+                        'ORDER BY attempts, queued_at LIMIT %s',
+                        [self.MAX_ATTEMPTS, size])
+            return [row[0] for row in cur.fetchall()]
+
+    def done(self, vids):
+        """Removes videos from the queue."""
+        if len(vids) == 0:
+            return
+
+        with self.conn.cursor() as cur:
+            cur.execute('DELETE FROM metadata_queue WHERE vid IN '
+                        f'({", ".join(["%s"] * len(vids))})', vids)
+
+    def failed(self, vid, error):
+        """Records a failed attempt at fetching the metadata of a video."""
+        with self.conn.cursor() as cur:
+            cur.execute('UPDATE metadata_queue SET attempts = attempts + 1, '
+                        'last_error = %s WHERE vid = %s', [str(error), vid])
+
+    def status(self):
+        """Gets the size of the backlog."""
+        with self.conn.cursor() as cur:
+            cur.execute('SELECT COALESCE(SUM(attempts < %s), 0), '
+                        'COALESCE(SUM(attempts >= %s), 0) FROM metadata_queue',
+                        [self.MAX_ATTEMPTS, self.MAX_ATTEMPTS])
+            row = cur.fetchone()
+
+        return {
+            'pending': int(row[0]),
+            'failed': int(row[1])
+        }
+
+class EnrichmentWorker:
+    """Fetches missing metadata from the queue in bounded parallel batches."""
+
+    def __init__(self, workers = None, batch_size = None,
+                 logger = ConsoleLogger()):
+        settings = read_config()['settings']
+        self.workers = workers or settings.get('enrichment_workers', 4)
+        self.batch_size = batch_size or settings.get('enrichment_batch', 20)
+        self.logger = logger
+        self.queue = MetadataQueue()
+
+    def run(self, watch = None):
+        """Works through the queue until it's empty or forever if watching."""
+        self.queue.seed()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                batch = self.queue.next_batch(self.batch_size)
+                if len(batch) == 0:
+                    if watch is None:
+                        break
+
+                    time.sleep(watch)
+                    continue
+
+                self._process(pool, batch)
+
+    def _process(self, pool, batch):
+        """Enriches a batch of videos."""
+        # Get the videos from the database.
+        videos = []
+        for vid in batch:
+            try:
+                videos.append(video.Video().from_id(vid))
+            except VideoNotFound as err:
+                self.queue.failed(vid, err)
+
+        # Only the extraction happens in parallel, the database is ours.
+        futures = [(vd, pool.submit(vd._extract_metadata, self.logger))
+                   for vd in videos]
+        enriched = []
+        for vd, future in futures:
+            try:
+                future.result()
+                enriched.append(vd)
+                print(f'{fg.green}Fetched metadata for {vd.video_id}{fg.rs}')
+            except Exception as err:
+                self.queue.failed(vd.video_id, err)
+                print(f'{fg.red}Error: Failed to fetch metadata for '
+                      f'{vd.video_id}\n{err}{fg.rs}')
+
+        # Save the whole batch at once.
+        video.Video.save_many(enriched)
+        self.queue.done([vd.video_id for vd in enriched])
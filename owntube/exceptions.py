@@ -25,3 +25,35 @@ class VideoDownloadError(OwnTubeBaseException):
     def __init__(self, message = "An error occurred while downloading the video", data = None):
         super().__init__(message)
         self.data = data
+
+class DatabasePoolExhausted(OwnTubeBaseException):
+    def __init__(self, message = "Timed out waiting for a database connection"):
+        super().__init__(message)
+
+class InvalidCursor(OwnTubeBaseException):
+    def __init__(self, message = "The page cursor is invalid"):
+        super().__init__(message)
+
+class InvalidSearch(OwnTubeBaseException):
+    def __init__(self, message = "A search query must be provided"):
+        super().__init__(message)
+
+class DownloadJobNotFound(OwnTubeBaseException):
+    def __init__(self, message = "Download job wasn't found in the database"):
+        super().__init__(message)
+
+class InvalidHeight(OwnTubeBaseException):
+    def __init__(self, message = "The height of a download must be a whole number of pixels between 144 and 4320"):
+        super().__init__(message)
+
+class ImageNotFound(OwnTubeBaseException):
+    def __init__(self, message = "Image wasn't found in the store"):
+        super().__init__(message)
+
+class FetchError(OwnTubeBaseException):
+    def __init__(self, message = "An error occurred while fetching a resource"):
+        super().__init__(message)
+
+class UnsupportedDatabase(OwnTubeBaseException):
+    def __init__(self, message = "The database backend isn't supported"):
+        super().__init__(message)
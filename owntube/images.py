@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""Fetching, resizing and content-addressed storage of thumbnails and
+avatars."""
+
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from os.path import abspath, dirname, exists
+
+from sty import fg
+
+from owntube.utils.cache import get_cache
+from owntube.utils.commonutils import db_connect, db_dialect, read_config
+from owntube.utils.fetcher import FetchEngine
+from owntube.timeline import Timeline
+from owntube.exceptions import FetchError
+
+# Extensions of the image types that we know about.
+_EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/webp': 'webp'
+}
+
+@lru_cache(maxsize=None)
+def pillow():
+    """Gets Pillow's Image module, loaded the first time an image has to be
+    resized. Resizing is optional, without Pillow only the originals are
+    served, so this is None if it isn't installed."""
+    try:
+        from PIL import Image
+        return Image
+    except ImportError:
+        return None
+
+def best_thumbnail(thumbs):
+    """Gets the URL of the highest resolution image of a thumbnails list."""
+    url = None
+    resolution = 0
+    for thumbnail in thumbs.values():
+        tbres = thumbnail.get('width', 0) * thumbnail.get('height', 0)
+        if url is None or tbres > resolution:
+            resolution = tbres
+            url = thumbnail['url']
+
+    return url
+
+class ImagePipeline:
+    """Downloads images through the shared fetch engine, stores them by the
+    hash of their contents along with resized variants and remembers where
+    they came from so that unchanged images aren't downloaded again."""
+
+    # Location of the stored images.
+    STORE_DIR = dirname(abspath(__file__)) + '/static/images'
+
+    _shared = None
+    _lock = threading.Lock()
+
+    def __init__(self, workers = None):
+        settings = read_config()['settings']
+        self.workers = workers or settings.get('image_workers', 8)
+        self.variants = settings.get('image_variants',
+                                     { 'list': 320, 'detail': 1280 })
+        self.quality = settings.get('image_quality', 80)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.engine = FetchEngine.shared()
+
+    @classmethod
+    def shared(cls):
+        """Gets the pipeline of the process."""
+        with cls._lock:
+            if cls._shared is None:
+                cls._shared = ImagePipeline()
+
+            return cls._shared
+
+    def submit(self, kind, images):
+        """Starts fetching a list of (owner ID, URL) pairs of a kind of image
+        (thumbnails or avatars). Returns futures to be given to collect."""
+        images = [(owner, url) for owner, url in images if url is not None]
+        known = self._records(kind, [owner for owner, url in images])
+
+        return [self.executor.submit(self._fetch, kind, owner, url,
+                                     known.get(owner))
+                for owner, url in images]
+
+    def collect(self, futures):
+        """Waits for fetches to finish, records where the images were stored
+        and returns the number of bytes downloaded."""
+        records = []
+        nbytes = 0
+        for future in futures:
+            record, size = future.result()
+            nbytes += size
+            if record is not None:
+                records.append(record)
+
+        self._save_records(records)
+        return nbytes
+
+    def fetch(self, kind, owner, url):
+        """Fetches a single image and returns the number of bytes
+        downloaded."""
+        return self.collect(self.submit(kind, [(owner, url)]))
+
+    def shutdown(self):
+        """Waits for the pending fetches and stops the workers."""
+        self.executor.shutdown()
+
+    @classmethod
+    def lookup(cls, kind, owner):
+        """Gets the stored file name and extension of an image."""
+        with db_connect().cursor() as cur:
+            cur.execute('SELECT hash, extension FROM images '
+                        'WHERE kind = %s AND owner = %s', [kind, owner])
+            return cur.fetchone()
+
+    @classmethod
+    def path(cls, digest, extension, variant = None):
+        """Location of a stored image or one of its variants."""
+        name = digest if variant is None else f'{digest}_{variant}'
+        return f'{cls.STORE_DIR}/{digest[:2]}/{name}.{extension}'
+
+    def _fetch(self, kind, owner, url, known):
+        """Downloads an image unless the one we have is still current. Returns
+        the record to be saved (if anything changed) and the bytes
+        downloaded."""
+        headers = {}
+        if known is not None and known['url'] == url and \
+                exists(self.path(known['hash'], known['extension'])):
+            if known['etag'] is None:
+                return None, 0
+            headers['If-None-Match'] = known['etag']
+
+        try:
+            resp = self.engine.fetch(url, headers, timeout=30)
+            if resp.status_code == 304:
+                return None, 0
+            if resp.status_code != 200:
+                raise FetchError(f'HTTP {resp.status_code}')
+        except FetchError as err:
+            print(f'{fg.red}Error: Failed to fetch image from {url}\n'
+                  f'{err}{fg.rs}')
+            return None, 0
+
+        # Store it unless we already have the exact same image.
+        data = resp.content
+        digest = hashlib.sha1(data).hexdigest()
+        extension = _EXTENSIONS.get(
+            resp.headers.get('Content-Type', '').split(';')[0], 'jpg')
+        if not exists(self.path(digest, extension)):
+            self._store(digest, extension, data)
+
+        return {
+            'kind': kind,
+            'owner': owner,
+            'url': url,
+            'etag': resp.headers.get('ETag'),
+            'hash': digest,
+            'extension': extension
+        }, len(data)
+
+    def _store(self, digest, extension, data):
+        """Writes an image and its resized variants to the store."""
+        os.makedirs(f'{self.STORE_DIR}/{digest[:2]}', exist_ok=True)
+
+        # Variants go first so that the original marks a complete set.
+        Image = pillow()
+        if Image is not None:
+            try:
+                with Image.open(BytesIO(data)) as image:
+                    image.load()
+                    for name, width in self.variants.items():
+                        self._write_variant(image, digest, name, width)
+            except OSError as err:
+                print(f'{fg.red}Error: Failed to resize image {digest}\n'
+                      f'{err}{fg.rs}')
+
+        self._write(self.path(digest, extension), data)
+
+    def _write_variant(self, image, digest, name, width):
+        """Writes a WebP copy of an image that is at most width pixels
+        wide."""
+        if image.width > width:
+            image = image.resize(
+                (width, max(1, round(image.height * width / image.width))),
+                pillow().LANCZOS)
+
+        buf = BytesIO()
+        image.convert('RGB').save(buf, 'WEBP', quality=self.quality)
+        self._write(self.path(digest, 'webp', name), buf.getvalue())
+
+    @staticmethod
+    def _write(path, data):
+        """Writes a file atomically so that readers never see half of it."""
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+
+    def _records(self, kind, owners):
+        """Gets what we know about the stored images of a list of owners."""
+        known = {}
+        with db_connect().cursor() as cur:
+            for i in range(0, len(owners), 1000):
+                chunk = owners[i:i + 1000]
+                cur.execute('SELECT owner, url, etag, hash, extension '
+                            'FROM images WHERE kind = %s AND owner IN '
+                            f'({", ".join(["%s"] * len(chunk))})',
+                            [kind] + chunk)
+                for owner, url, etag, digest, extension in cur.fetchall():
+                    known[owner] = { 'url': url, 'etag': etag,
+                                     'hash': digest, 'extension': extension }
+
+        return known
+
+    def _save_records(self, records):
+        """Remembers where a list of images came from and where they are."""
+        if len(records) == 0:
+            return
+
+        upsert = db_dialect().replace_columns(('url', 'etag', 'hash',
+                                               'extension'))
+        avatars = [record['owner'] for record in records
+                   if record['kind'] == 'avatars']
+        conn = db_connect()
+        conn.start_transaction()
+        try:
+            with conn.cursor() as cur:
+                cur.executemany(
+                    'INSERT INTO images(kind, owner, url, etag, hash, '
+                    f'extension) VALUES (%s, %s, %s, %s, %s, %s) {upsert}',
+                    [(record['kind'], record['owner'], record['url'],
+                      record['etag'], record['hash'], record['extension'])
+                     for record in records])
+
+                # The home feed has the avatars of the channels in it.
+                Timeline().refresh_channels(cur, avatars)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        if len(avatars) > 0:
+            get_cache().bump(['channels'])
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""Parallel and resumable importer of subscription dumps."""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from glob import glob
+from os.path import basename, exists
+
+from sty import fg
+
+from owntube.channel import Channel
+from owntube.images import ImagePipeline
+from owntube.timeline import Timeline
+from owntube.utils.commonutils import db_release, read_config
+from owntube.video import Video
+
+class ImportStats:
+    """Thread-safe tally of the work done by an import."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+        self.channels = 0
+        self.videos = 0
+        self.skipped = 0
+        self.images = 0
+        self.nbytes = 0
+
+    def add(self, videos = 0, skipped = 0, images = 0, nbytes = 0):
+        """Accounts for a finished channel."""
+        with self.lock:
+            self.channels += 1
+            self.videos += videos
+            self.skipped += skipped
+            self.images += images
+            self.nbytes += nbytes
+
+    def summary(self):
+        """Human-readable summary of the throughput of the import."""
+        elapsed = max(time.monotonic() - self.start, 0.001)
+        return f'Imported {self.videos} videos ({self.skipped} skipped) from ' \
+               f'{self.channels} channels in {elapsed:.1f}s: ' \
+               f'{self.videos / elapsed:.1f} videos/s, ' \
+               f'{self.images / elapsed:.1f} images/s, ' \
+               f'{self.nbytes / 1048576:.1f} MiB ' \
+               f'({self.nbytes / elapsed / 1024:.1f} KiB/s)'
+
+class DumpImporter:
+    """Imports the dump files of a directory using a pool of channel workers
+    and a separate, bounded image pipeline."""
+
+    # Name of the checkpoint file inside the dump directory.
+    CHECKPOINT = '.import_checkpoint.json'
+
+    def __init__(self, dump_dir, jobs = 4, image_jobs = 8):
+        self.dump_dir = dump_dir
+        self.jobs = jobs
+        self.image_jobs = image_jobs
+        self.stats = ImportStats()
+        self.lock = threading.Lock()
+        self.done = set()
+
+    @property
+    def checkpoint_path(self):
+        """Location of the checkpoint file."""
+        return f'{self.dump_dir}/{self.CHECKPOINT}'
+
+    def run(self, restart = False):
+        """Imports every dump that hasn't been imported yet."""
+        if not restart:
+            self._load_checkpoint()
+
+        # Keep every known video in memory if we were asked to.
+        if read_config()['settings'].get('warm_id_cache', False):
+            try:
+                Video.warm_ids()
+            finally:
+                db_release()
+
+        # Figure out what's left to do.
+        dumps = glob(f'{self.dump_dir}/*.json') + \
+            glob(f'{self.dump_dir}/*.jsonl')
+        pending = [fname for fname in sorted(dumps)
+                   if basename(fname) not in self.done]
+        if len(self.done) > 0:
+            print(f'Resuming import, {len(self.done)} dumps already imported')
+
+        # Import the channels in parallel.
+        images = ImagePipeline(self.image_jobs)
+        with ThreadPoolExecutor(max_workers=self.jobs) as channels:
+            futures = {channels.submit(self._import, fname, images): fname
+                       for fname in pending}
+            failures = 0
+            for future in as_completed(futures):
+                fname = futures[future]
+                try:
+                    future.result()
+                    self._mark_done(fname)
+                except Exception as err:
+                    failures += 1
+                    print(f'{fg.red}Error: Failed to import {fname}\n'
+                          f'{err}{fg.rs}')
+        images.shutdown()
+
+        # Videos that were imported out of order may have missed the timeline.
+        try:
+            Timeline().rebuild()
+        finally:
+            db_release()
+
+        # Start afresh next time if everything went well.
+        if failures == 0 and exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+        print(f'{fg.green}{self.stats.summary()}{fg.rs}')
+
+    def _import(self, fname, images):
+        """Imports a single dump file."""
+        try:
+            Channel.import_from_dump(fname, images=images, stats=self.stats)
+        finally:
+            db_release()
+
+    def _load_checkpoint(self):
+        """Loads the list of dumps that have already been imported."""
+        if exists(self.checkpoint_path):
+            with open(self.checkpoint_path, 'r') as fh:
+                self.done = set(json.load(fh)['done'])
+
+    def _mark_done(self, fname):
+        """Records a dump as imported in the checkpoint file."""
+        with self.lock:
+            self.done.add(basename(fname))
+
+            # Write it atomically so that a crash can't corrupt it.
+            tmp = self.checkpoint_path + '.tmp'
+            with open(tmp, 'w') as fh:
+                json.dump({ 'done': sorted(self.done) }, fh)
+            os.replace(tmp, self.checkpoint_path)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""Incremental poller of the channels' RSS feeds."""
+
+import time
+from datetime import datetime, timedelta
+
+from sty import fg
+
+from owntube.channel import Channel, YouTubeRSS
+from owntube.enrichment import MetadataQueue
+from owntube.images import ImagePipeline, best_thumbnail
+from owntube.utils.commonutils import db_connect, db_dialect, read_config
+from owntube.utils.fetcher import FetchEngine
+from owntube.video import Video
+
+def next_interval(entries, interval, changed, min_interval, max_interval):
+    """Figures out how long to wait before polling a feed again based on how
+    often the channel uploads."""
+    # Nothing changed, so back off a little.
+    if not changed:
+        return min(int(interval * 1.5), max_interval)
+
+    # Poll about four times for each upload gap.
+    dates = sorted((entry['published'] for entry in entries), reverse=True)
+    if len(dates) < 2:
+        return max_interval
+    gap = (dates[0] - dates[-1]).total_seconds() / (len(dates) - 1)
+
+    return max(min_interval, min(int(gap / 4), max_interval))
+
+def new_entries(entries, known):
+    """Filters the feed entries that aren't known yet."""
+    return [entry for entry in entries if entry['video_id'] not in known]
+
+class SubscriptionPoller:
+    """Polls the feeds of every channel in the database for new uploads."""
+
+    def __init__(self, workers = None, min_interval = None,
+                 max_interval = None):
+        settings = read_config()['settings']
+        self.workers = workers or settings.get('poller_workers', 32)
+        self.min_interval = min_interval or \
+            settings.get('poll_min_interval', 900)
+        self.max_interval = max_interval or \
+            settings.get('poll_max_interval', 86400)
+        self.conn = db_connect()
+
+        # Keep every known video in memory if we were asked to.
+        if settings.get('warm_id_cache', False):
+            Video.warm_ids()
+
+    def run(self, watch = None):
+        """Polls the feeds that are due, forever if watching."""
+        while True:
+            self.poll()
+            if watch is None:
+                return
+
+            time.sleep(watch)
+
+    def poll(self):
+        """Polls every feed that is due and imports the new videos."""
+        start = time.monotonic()
+        due = self._due_channels()
+        if len(due) == 0:
+            return
+
+        # Fetch the feeds concurrently and parse them.
+        resps = FetchEngine.shared().fetch_many(
+            [(YouTubeRSS(chan.channel_id).url,
+              YouTubeRSS.conditional_headers(etag, last_modified))
+             for chan, etag, last_modified, interval in due],
+            limit=self.workers)
+        results = [self._read(state, resp) for state, resp in zip(due, resps)]
+
+        # Figure out which videos we don't have yet.
+        entries = [entry for result in results if result['entries'] is not None
+                   for entry in result['entries']]
+        known = Video.existing_ids([entry['video_id'] for entry in entries])
+
+        # Import the new ones.
+        videos = []
+        thumbs = []
+        for result in results:
+            if result['entries'] is None:
+                continue
+
+            for entry in new_entries(result['entries'], known):
+                videos.append(Video(result['channel'], entry['video_id'],
+                                    entry['title'], entry['description'],
+                                    entry['published']))
+                thumbs.append(entry['thumbnails'])
+        Video.save_many(videos)
+        MetadataQueue().enqueue([video.video_id for video in videos])
+
+        # Fetch the thumbnails of the new videos.
+        images = ImagePipeline.shared()
+        images.collect(images.submit('thumbnails', [
+            (vd.video_id, best_thumbnail(th))
+            for vd, th in zip(videos, thumbs) if th]))
+
+        self._save_state(results)
+        errors = sum(1 for result in results if result['error'] is not None)
+        print(f'Polled {len(due)} feeds in {time.monotonic() - start:.1f}s, '
+              f'{fg.green}{len(videos)} new videos{fg.rs}' +
+              (f', {fg.red}{errors} errors{fg.rs}' if errors > 0 else ''))
+
+    def _read(self, state, resp):
+        """Parses the response of a single feed."""
+        chan, etag, last_modified, interval = state
+        result = {
+            'channel': chan,
+            'entries': None,
+            'etag': etag,
+            'last_modified': last_modified,
+            'interval': interval,
+            'error': None
+        }
+
+        try:
+            if isinstance(resp, Exception):
+                raise resp
+
+            xml, result['etag'], result['last_modified'] = \
+                YouTubeRSS(chan.channel_id).read_if_modified(
+                    resp, etag, last_modified)
+            if xml is not None:
+                result['entries'] = YouTubeRSS.parse(xml)
+        except Exception as err:
+            result['error'] = err
+            print(f'{fg.red}Error: Failed to poll the feed of {chan.name}\n'
+                  f'{err}{fg.rs}')
+
+        result['interval'] = next_interval(
+            result['entries'] or [], interval, result['entries'] is not None,
+            self.min_interval, self.max_interval)
+
+        return result
+
+    def _due_channels(self):
+        """Gets the channels whose feeds are due for polling."""
+        with self.conn.cursor() as cur:
+            cur.execute('SELECT channels.cid, channels.name, feed_state.etag, '
+                        'feed_state.last_modified, feed_state.poll_interval '
+                        'FROM channels LEFT JOIN feed_state '
+                        'ON feed_state.cid = channels.cid '
+                        'WHERE feed_state.next_poll IS NULL '
+                        'OR feed_state.next_poll <= %s',
+                        [datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')])
+            return [(Channel(row[0], row[1]), row[2], row[3],
+                     row[4] or self.min_interval)
+                    for row in cur.fetchall()]
+
+    def _save_state(self, results):
+        """Stores the validators and next poll times of the feeds."""
+        now = datetime.utcnow()
+        upsert = db_dialect().replace_columns(('etag', 'last_modified',
+                                               'poll_interval', 'next_poll'))
+        with self.conn.cursor() as cur:
+            cur.executemany(
+                'INSERT INTO feed_state(cid, etag, last_modified, '
+                'poll_interval, next_poll) VALUES (%s, %s, %s, %s, %s) '
+                f'{upsert}',
+                [(result['channel'].channel_id, result['etag'],
+                  result['last_modified'], result['interval'],
+                  (now + timedelta(seconds=result['interval']))
+                  .strftime('%Y-%m-%d %H:%M:%S'))
+                 for result in results])
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""Full-text search over the videos in the database."""
+
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+
+from mysql.connector import errorcode
+from mysql.connector.errors import ProgrammingError
+
+from owntube.utils.commonutils import db_connect, db_dialect, db_release, \
+    read_config
+from owntube.utils.pagination import default_count
+import owntube.channel as channel
+import owntube.video as video
+
+# Splits text into search terms.
+_TOKEN_REGEX = re.compile(r'\w{2,}', re.UNICODE)
+
+def tokenize(text):
+    """Breaks up a piece of text into lowercase search terms."""
+    if text is None:
+        return []
+
+    return _TOKEN_REGEX.findall(text.lower())
+
+class VideoSearch:
+    """Searches the titles and descriptions of the videos ranked by relevance,
+    using the FULLTEXT index (FTS5 on SQLite) or the in-process index if that
+    isn't available."""
+
+    # Search modes and their MySQL counterparts.
+    MODES = {
+        'natural': 'IN NATURAL LANGUAGE MODE',
+        'boolean': 'IN BOOLEAN MODE'
+    }
+
+    def __init__(self):
+        self.conn = db_connect()
+
+    def search(self, query, mode = 'natural', chan = None, count = None,
+               after = None):
+        """Searches for videos, optionally within a channel. The after argument
+        is the sort key of the last result of the previous page. Returns a list
+        of (video, score) pairs."""
+        count = default_count(count)
+        if mode not in self.MODES:
+            mode = 'natural'
+
+        if read_config()['settings'].get('search_backend') != 'index':
+            if db_dialect().name == 'sqlite':
+                return self._fts5(query, mode, chan, count, after)
+
+            try:
+                return self._fulltext(query, mode, chan, count, after)
+            except ProgrammingError as err:
+                if err.errno != errorcode.ER_FT_MATCHING_KEY_NOT_FOUND:
+                    raise
+
+        return InvertedIndex.shared().search(query, mode, chan, count, after)
+
+    def _fulltext(self, query, mode, chan, count, after):
+        """Searches using the FULLTEXT index of the database."""
+        match = f'MATCH(videos.title, videos.description) ' \
+                f'AGAINST (%s {self.MODES[mode]})'
+        stmt = f'SELECT {video.Video._select_columns("videos")}, ' \
+               f'{channel.Channel._select_columns("channels")}, ' \
+               f'{match} AS score FROM videos INNER JOIN channels ' \
+               f'ON channels.cid = videos.channel_cid WHERE {match} '
+        params = [query, query]
+        if chan is not None:
+            stmt += 'AND videos.channel_cid = %s '
+            params.append(chan.channel_id)
+        if after is not None:
+            stmt += 'HAVING score < %s OR (score = %s AND videos.vid > %s) '
+            params += [float(after[0]), float(after[0]), after[1]]
+        stmt += 'ORDER BY score DESC, videos.vid LIMIT %s'
+        params.append(count)
+
+        return self._results(stmt, params)
+
+    def _fts5(self, query, mode, chan, count, after):
+        """Searches using the FTS5 index of SQLite, ranked by BM25 with titles
+        weighted the same way as in the in-process index."""
+        match = self._fts5_query(query, mode)
+        if match is None:
+            return []
+
+        score = f'-bm25(videos_fts, {InvertedIndex.TITLE_WEIGHT}, 1)'
+        stmt = f'SELECT {video.Video._select_columns("videos")}, ' \
+               f'{channel.Channel._select_columns("channels")}, ' \
+               f'{score} AS score FROM videos_fts INNER JOIN videos ' \
+               'ON videos.rowid = videos_fts.rowid INNER JOIN channels ' \
+               'ON channels.cid = videos.channel_cid ' \
+               'WHERE videos_fts MATCH %s '
+        params = [match]
+        if chan is not None:
+            stmt += 'AND videos.channel_cid = %s '
+            params.append(chan.channel_id)
+        if after is not None:
+            stmt += f'AND ({score} < %s OR ({score} = %s AND ' \
+                    'videos.vid > %s)) '
+            params += [float(after[0]), float(after[0]), after[1]]
+        stmt += 'ORDER BY score DESC, videos.vid LIMIT %s'
+        params.append(count)
+
+        return self._results(stmt, params)
+
+    @staticmethod
+    def _fts5_query(query, mode):
+        """Translates a search into an FTS5 query, or None if there's nothing
+        to search for. Optional terms are ignored when there are required
+        ones, since FTS5 can't use them only for ranking."""
+        required, excluded, optional = InvertedIndex._parse(query, mode)
+        quote = lambda terms: [f'"{term}"' for term in terms]
+        if len(required) > 0:
+            match = ' AND '.join(quote(required))
+        elif len(optional) > 0:
+            match = ' OR '.join(quote(optional))
+        else:
+            return None
+
+        if len(excluded) > 0:
+            match = f'({match}) NOT ({" OR ".join(quote(excluded))})'
+
+        return match
+
+    def _results(self, stmt, params):
+        """Gets the (video, score) pairs of a query whose rows have the
+        columns of a video, its channel and the score."""
+        results = []
+        channels = {}
+        for row in self._rows(stmt, params):
+            vd = video.Video()._from_row(
+                row[:len(video.Video.COLUMNS)],
+                channels=video.Video._channel_map(channels, row[:-1]))
+            results.append((vd, row[-1]))
+
+        return results
+
+    def _rows(self, stmt, params):
+        """Gets the rows of a query."""
+        with self.conn.cursor() as cur:
+            cur.execute(stmt, params)
+            return cur.fetchall()
+
+class InvertedIndex:
+    """Precomputed in-process index of the titles and descriptions."""
+
+    # Weight of a term found in the title compared to the description.
+    TITLE_WEIGHT = 3
+
+    _shared = None
+    _building = None
+    _failure = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.channels = {}
+        self.built_at = None
+
+    @classmethod
+    def shared(cls):
+        """Gets the index of the process. Stale indexes are rebuilt in the
+        background while the old one keeps on serving searches, so only the
+        searches made before the first one is built have to wait for it."""
+        ttl = read_config()['settings'].get('search_index_ttl', 600)
+        with cls._lock:
+            current = cls._shared
+            if cls._building is None and (current is None or
+                    time.monotonic() - current.built_at > ttl):
+                cls._building = threading.Event()
+                threading.Thread(target=cls._rebuild, args=(cls._building,),
+                                 daemon=True).start()
+            building = cls._building
+
+        if current is not None:
+            return current
+
+        building.wait()
+        if cls._shared is None:
+            raise cls._failure
+        return cls._shared
+
+    @classmethod
+    def _rebuild(cls, done):
+        """Builds a new index and swaps it in for the old one."""
+        try:
+            index = InvertedIndex().build()
+            with cls._lock:
+                cls._shared = index
+        except Exception as err:
+            cls._failure = err
+        finally:
+            db_release()
+            with cls._lock:
+                cls._building = None
+            done.set()
+
+    def build(self):
+        """Builds the index from the database."""
+        conn = db_connect()
+        with conn.cursor() as cur:
+            cur.execute('SELECT vid, channel_cid, title, description '
+                        'FROM videos')
+            for vid, cid, title, description in cur:
+                self.channels[vid] = cid
+                for term in tokenize(title):
+                    self._add(term, vid, self.TITLE_WEIGHT)
+                for term in tokenize(description):
+                    self._add(term, vid, 1)
+
+        self.built_at = time.monotonic()
+        return self
+
+    def search(self, query, mode, chan, count, after):
+        """Searches the index the same way as the FULLTEXT search would."""
+        required, excluded, optional = self._parse(query, mode)
+
+        # Score every video that matches any of the terms.
+        scores = defaultdict(float)
+        for term in required + optional:
+            postings = self.postings.get(term, {})
+            if len(postings) == 0:
+                continue
+
+            idf = math.log(1 + len(self.channels) / len(postings))
+            for vid, tf in postings.items():
+                scores[vid] += tf * idf
+
+        # Apply the filters.
+        ranked = []
+        for vid, score in scores.items():
+            if any(vid not in self.postings.get(term, {}) for term in required):
+                continue
+            if any(vid in self.postings.get(term, {}) for term in excluded):
+                continue
+            if chan is not None and self.channels[vid] != chan.channel_id:
+                continue
+
+            score = round(score, 6)
+            if after is not None and not (score < float(after[0]) or (
+                    score == float(after[0]) and vid > after[1])):
+                continue
+            ranked.append((-score, vid))
+
+        # Fetch the page of videos, carrying on down the ranking in place of
+        # the ones that were deleted since the index was built so that pages
+        # are only short at the end.
+        ranked.sort()
+        results = []
+        start = 0
+        while len(results) < count and start < len(ranked):
+            page = ranked[start:start + count - len(results)]
+            start += len(page)
+            scores = dict((vid, -score) for score, vid in page)
+            results += [(vd, scores[vd.video_id]) for vd in
+                        video.Video().from_ids(list(scores))]
+
+        return results
+
+    def _add(self, term, vid, weight):
+        """Adds an occurrence of a term in a video to the index."""
+        postings = self.postings[term]
+        postings[vid] = postings.get(vid, 0) + weight
+
+    @staticmethod
+    def _parse(query, mode):
+        """Splits a query into required, excluded and optional terms."""
+        required = []
+        excluded = []
+        optional = []
+        for word in query.split():
+            terms = tokenize(word)
+            if mode == 'boolean' and word.startswith('+'):
+                required += terms
+            elif mode == 'boolean' and word.startswith('-'):
+                excluded += terms
+            else:
+                optional += terms
+
+        return required, excluded, optional
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Incremental sync of the catalog for mirrors through the change log."""
+
+from owntube.channel import Channel
+from owntube.utils.commonutils import batched, db_connect, read_config
+from owntube.video import DownloadedVideo, Video
+
+class ChangeFeed:
+    """Reads the change log in batches, with the current state of each item
+    that changed."""
+
+    # Kinds of items in the log and their models, parents first.
+    KINDS = {
+        'channels': Channel,
+        'videos': Video,
+        'downloaded_videos': DownloadedVideo
+    }
+
+    def __init__(self):
+        self.conn = db_connect()
+
+    def batch(self, after = 0, count = None):
+        """Gets the items that changed after a sequence number of the log,
+        grouped by their kind, along with the sequence number to continue
+        from and whether there are more changes waiting. Sequence numbers are
+        handed out in the order that the transactions commit, so nothing can
+        show up behind the ones that were already read."""
+        max_count = read_config()['settings'].get('sync_batch', 500)
+        count = max_count if count is None else max(1, min(count, max_count))
+
+        # Find out what changed.
+        with self.conn.cursor() as cur:
+            cur.execute('SELECT seq, kind, item, deleted FROM changes '
+                        'WHERE seq > %s ORDER BY seq LIMIT %s',
+                        [after, count + 1])
+            changes = cur.fetchall()
+        more = len(changes) > count
+        changes = changes[:count]
+
+        # Gather up the current state of what changed.
+        resp = { kind: [] for kind in self.KINDS }
+        resp['deleted'] = { kind: [] for kind in self.KINDS }
+        for kind, model in self.KINDS.items():
+            items = [item for seq, k, item, deleted in changes
+                     if k == kind and not deleted]
+            rows = self._rows(model, items)
+            for seq, k, item, deleted in changes:
+                if k != kind:
+                    continue
+
+                # Items may have been deleted without a tombstone by the
+                # database cascading a delete.
+                row = rows.get(item)
+                if row is None:
+                    resp['deleted'][kind].append(self._key(kind, item))
+                else:
+                    resp[kind].append(self._dict_from_row(kind, row))
+
+        resp['seq'] = changes[-1][0] if len(changes) > 0 else after
+        resp['more'] = more
+        return resp
+
+    def _rows(self, model, keys):
+        """Fetches the rows of items by their IDs, which are given as text."""
+        rows = {}
+        with self.conn.cursor() as cur:
+            for chunk in batched(keys, 500):
+                cur.execute(f'SELECT {", ".join(model.COLUMNS)} '
+                            f'FROM {model.TABLE} WHERE {model.COLUMNS[0]} '
+                            f'IN ({", ".join(["%s"] * len(chunk))})', chunk)
+                for row in cur.fetchall():
+                    rows[str(row[0])] = row
+
+        return rows
+
+    @staticmethod
+    def _key(kind, item):
+        """ID of an item as found in its dictionary. The log keeps every ID
+        as text, but the downloaded videos are numbered."""
+        return int(item) if kind == 'downloaded_videos' else item
+
+    @staticmethod
+    def _dict_from_row(kind, row):
+        """Dictionary of an item, with the ID of its parent so that mirrors
+        can put it in its place."""
+        if kind == 'channels':
+            return Channel.dict_from_row(row)
+
+        if kind == 'videos':
+            d = Video.dict_from_row(row)
+            d['channel_id'] = row[1]
+            return d
+
+        d = DownloadedVideo.dict_from_row(row)
+        d['video_id'] = row[1]
+        return d
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""Materialized timeline of the newest videos of every channel, which serves
+the home feed without having to go through the whole archive."""
+
+import json
+
+from owntube.utils.cache import get_cache
+from owntube.utils.commonutils import db_connect, db_dialect, read_config
+from owntube.utils.queries import Template, execute
+
+class Timeline:
+    """Table that holds the newest videos with their channel and avatar joined
+    in. It always holds every video that is at least as new as its oldest one,
+    so a listing that runs past its end simply carries on in the videos
+    table."""
+
+    # Columns of the table in the order they are selected.
+    COLUMNS = ('vid', 'channel_cid', 'title', 'description', 'published_date',
+               'duration', 'width', 'height', 'fps', 'chapters',
+               'channel_name', 'channel_description', 'avatar_hash',
+               'avatar_extension')
+
+    # Where each of the columns comes from in the archive.
+    SOURCES = ('videos.vid', 'videos.channel_cid', 'videos.title',
+               'videos.description', 'videos.published_date',
+               'videos.duration', 'videos.width', 'videos.height',
+               'videos.fps', 'videos.chapters', 'channels.name',
+               'channels.description', 'images.hash', 'images.extension')
+
+    # Joins that build the rows of the table from the archive.
+    _ARCHIVE_FROM = 'FROM videos ' \
+        'INNER JOIN channels ON channels.cid = videos.channel_cid ' \
+        "LEFT JOIN images ON images.kind = 'avatars' " \
+        'AND images.owner = videos.channel_cid '
+
+    # Page of the timeline.
+    _PAGE = Template(
+        'TimelineRow',
+        f'SELECT {", ".join(COLUMNS)} FROM timeline {{where}}'
+        'ORDER BY published_date DESC, vid DESC {limit}',
+        COLUMNS,
+        {
+            'since': 'published_date >= %s',
+            'after': '(published_date < %s OR '
+                     '(published_date = %s AND vid < %s))'
+        })
+
+    # Page of the archive that is older than anything in the timeline.
+    _ARCHIVE = Template(
+        'TimelineRow',
+        f'SELECT {", ".join(SOURCES)} {_ARCHIVE_FROM}{{where}}'
+        'ORDER BY videos.published_date DESC, videos.vid DESC {limit}',
+        COLUMNS,
+        {
+            'since': 'videos.published_date >= %s',
+            'after': '(videos.published_date < %s OR '
+                     '(videos.published_date = %s AND videos.vid < %s))'
+        })
+
+    def __init__(self):
+        self.conn = db_connect()
+        self.dialect = db_dialect()
+
+    @property
+    def size(self):
+        """Number of videos that are kept in the timeline."""
+        return read_config()['settings'].get('timeline_size', 1000)
+
+    def iter_dicts(self, count=None, since=None, after=None):
+        """Iterates over the latest videos of every channel as dictionaries,
+        in the same shape as the expanded listings of videos. Pages are read
+        from the timeline and only the ones past its end reach the archive.
+        The after argument is the sort key of the last video of the previous
+        page."""
+        since = None if since is None else \
+            [since.strftime('%Y-%m-%d %H:%M:%S')]
+
+        # Serve as much as we can from the timeline.
+        served = 0
+        for row in execute(self.conn, self._PAGE.bind({
+                    'since': since, 'after': self._after(after) }, count)):
+            served += 1
+            after = (row.published_date.strftime('%Y-%m-%d %H:%M:%S'),
+                     row.vid)
+            yield self.dict_from_row(row)
+
+        # Carry on with the videos that are too old for it.
+        if count is not None:
+            if served == count:
+                return
+            count -= served
+        for row in execute(self.conn, self._ARCHIVE.bind({
+                    'since': since, 'after': self._after(after) }, count)):
+            yield self.dict_from_row(row)
+
+    @staticmethod
+    def dict_from_row(row):
+        """Builds the dictionary of a video with its channel expanded from a
+        row of the timeline, including the URL of the channel's avatar."""
+        return {
+            'id': row[0],
+            'title': row[2],
+            'description': row[3],
+            'published_date': row[4],
+            'duration': row[5],
+            'width': row[6],
+            'height': row[7],
+            'fps': row[8],
+            'chapters': None if (row[9] is None) else json.loads(row[9]),
+            'channel': {
+                'id': row[1],
+                'name': row[10],
+                'description': row[11],
+                'avatar': None if (row[12] is None) else
+                    f'/image/avatars/{row[1]}'
+            }
+        }
+
+    def refresh(self, cur, videos):
+        """Brings the timeline up to date with videos that are being saved,
+        given as their IDs and publishing dates, in the transaction of the
+        cursor. Videos that are older than everything in it are left out,
+        since the ones right before them aren't in it either."""
+        if len(videos) == 0:
+            return
+
+        # Locking the oldest video makes concurrent refreshes wait their turn.
+        cur.execute('SELECT published_date, vid FROM timeline '
+                    'ORDER BY published_date, vid LIMIT 1'
+                    f'{self.dialect.FOR_UPDATE}')
+        oldest = cur.fetchone()
+        if oldest is None:
+            # An empty timeline may either be new or have an empty archive.
+            self._fill(cur)
+            return
+
+        oldest = (oldest[0].strftime('%Y-%m-%d %H:%M:%S'), oldest[1])
+        vids = [vid for vid, date in videos if (date, vid) >= oldest]
+        if len(vids) == 0:
+            return
+
+        cur.execute(self._copy(f'WHERE videos.vid IN '
+                               f'({", ".join(["%s"] * len(vids))})'), vids)
+        self._trim(cur)
+
+    def refresh_channels(self, cur, cids):
+        """Brings the names, descriptions and avatars of channels in the
+        timeline up to date in the transaction of the cursor."""
+        if len(cids) == 0:
+            return
+
+        avatar = "(SELECT {} FROM images WHERE kind = 'avatars' " \
+            'AND owner = timeline.channel_cid)'
+        cur.execute('UPDATE timeline SET channel_name = (SELECT name '
+                    'FROM channels WHERE cid = timeline.channel_cid), '
+                    'channel_description = (SELECT description '
+                    'FROM channels WHERE cid = timeline.channel_cid), '
+                    f'avatar_hash = {avatar.format("hash")}, '
+                    f'avatar_extension = {avatar.format("extension")} '
+                    'WHERE channel_cid IN '
+                    f'({", ".join(["%s"] * len(cids))})', list(cids))
+
+    def rebuild(self):
+        """Fills the timeline from scratch with the newest videos of the
+        archive."""
+        self.conn.start_transaction()
+        try:
+            with self.conn.cursor() as cur:
+                self._fill(cur)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+        get_cache().bump(['videos'])
+
+    def count(self):
+        """Number of videos in the timeline."""
+        with self.conn.cursor() as cur:
+            cur.execute('SELECT COUNT(*) FROM timeline')
+            return cur.fetchone()[0]
+
+    def _fill(self, cur):
+        """Replaces everything in the timeline with the newest videos of the
+        archive."""
+        cur.execute('DELETE FROM timeline')
+        cur.execute(self._copy('ORDER BY videos.published_date DESC, '
+                               'videos.vid DESC LIMIT %s'), [self.size])
+
+    def _copy(self, rest):
+        """Builds a statement that copies videos from the archive into the
+        timeline, replacing the ones that are already in it."""
+        return f'REPLACE INTO timeline({", ".join(self.COLUMNS)}) ' \
+               f'SELECT {", ".join(self.SOURCES)} {self._ARCHIVE_FROM}{rest}'
+
+    def _trim(self, cur):
+        """Drops the videos that no longer fit in the timeline."""
+        cur.execute('SELECT published_date, vid FROM timeline '
+                    'ORDER BY published_date DESC, vid DESC '
+                    'LIMIT 1 OFFSET %s', [self.size - 1])
+        last = cur.fetchone()
+        if last is None:
+            return
+
+        date = last[0].strftime('%Y-%m-%d %H:%M:%S')
+        cur.execute('DELETE FROM timeline WHERE published_date < %s OR '
+                    '(published_date = %s AND vid < %s)',
+                    [date, date, last[1]])
+
+    @staticmethod
+    def _after(after):
+        """Parameters of the after clause for a sort key."""
+        return None if after is None else [after[0], after[0], after[1]]
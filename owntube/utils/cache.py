@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""Caches with generation counters used to invalidate them on writes."""
+
+import json
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from owntube.utils.commonutils import project_path, read_config
+
+class MemoryCache:
+    """In-process LRU cache whose entries expire after a while.
+
+    Generation counters only live in this process, so writes made by other
+    processes (importers, pollers) are only picked up once entries expire.
+    It's only meant for setups where the web server is the sole writer.
+    """
+
+    def __init__(self, size = 1024, ttl = 300):
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Gets an entry from the cache or None if there isn't a fresh one."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """Stores an entry in the cache, evicting the least recently used."""
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def generation(self, names):
+        """Gets the current generations of a list of names."""
+        with self.lock:
+            return [self.generations.get(name, 0) for name in names]
+
+    def bump(self, names):
+        """Increments the generations of a list of names, invalidating the
+        entries that depended on them."""
+        with self.lock:
+            for name in names:
+                self.generations[name] = self.generations.get(name, 0) + 1
+
+    def stats(self):
+        """Metrics about the usage of the cache."""
+        with self.lock:
+            return {
+                'backend': 'memory',
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+class DiskCache(MemoryCache):
+    """Cache shared between processes through an SQLite database on disk, so
+    that writes made by any process invalidate it right away."""
+
+    def __init__(self, path, size = 1024, ttl = 300):
+        super().__init__(size, ttl)
+        self.path = path
+        self.local = threading.local()
+
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS entries(key TEXT '
+                              'PRIMARY KEY, value BLOB, expires REAL, '
+                              'used REAL)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS entries_used '
+                              'ON entries (used)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS generations(name '
+                              'TEXT PRIMARY KEY, gen INTEGER NOT NULL)')
+
+    @property
+    def conn(self):
+        """SQLite connection of the current thread."""
+        if not hasattr(self.local, 'conn'):
+            self.local.conn = sqlite3.connect(self.path, timeout=5)
+            self.local.conn.execute('PRAGMA journal_mode = WAL')
+            self.local.conn.execute('PRAGMA synchronous = NORMAL')
+
+        return self.local.conn
+
+    def get(self, key):
+        return self._get(key, time.time())
+
+    def _get(self, key, expires_after):
+        """Gets an entry that expires after a point in time."""
+        row = self.conn.execute('SELECT value FROM entries WHERE key = ? '
+                                'AND expires > ?',
+                                [key, expires_after]).fetchone()
+        with self.lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        with self.conn:
+            self.conn.execute('UPDATE entries SET used = ? WHERE key = ?',
+                              [time.time(), key])
+        return self._decode(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO entries(key, value, '
+                              'expires, used) VALUES (?, ?, ?, ?)',
+                              [key, self._encode(value), now + self.ttl, now])
+            self.conn.execute('DELETE FROM entries WHERE key IN (SELECT key '
+                              'FROM entries ORDER BY used DESC LIMIT -1 '
+                              'OFFSET ?)', [self.size])
+
+    def generation(self, names):
+        gens = dict(self.conn.execute(
+            'SELECT name, gen FROM generations WHERE name IN '
+            f'({", ".join(["?"] * len(names))})', names).fetchall())
+        return [gens.get(name, 0) for name in names]
+
+    def bump(self, names):
+        with self.conn:
+            self.conn.executemany('INSERT INTO generations(name, gen) '
+                                  'VALUES (?, 1) ON CONFLICT(name) DO UPDATE '
+                                  'SET gen = gen + 1',
+                                  [(name,) for name in names])
+
+    def stats(self):
+        stats = super().stats()
+        stats['backend'] = 'disk'
+        stats['entries'] = self.conn.execute(
+            'SELECT COUNT(*) FROM entries').fetchone()[0]
+        return stats
+
+    @staticmethod
+    def _encode(value):
+        """Serializes a value to be stored."""
+        return pickle.dumps(value)
+
+    @staticmethod
+    def _decode(data):
+        """Deserializes a stored value."""
+        return pickle.loads(data)
+
+class InfoCache(DiskCache):
+    """Compressed on-disk cache of the info that yt-dlp extracts from videos,
+    keyed by their IDs, so that it doesn't have to be extracted again for
+    every metadata fetch and download."""
+
+    def get(self, key, max_age = None):
+        """Gets the info of a video, or None if we don't have it or it was
+        extracted more than max_age seconds ago."""
+        now = time.time()
+        if max_age is None:
+            return self._get(key, now)
+
+        return self._get(key, max(now, now + self.ttl - max_age))
+
+    def stats(self):
+        stats = super().stats()
+        stats['bytes'] = self.conn.execute(
+            'SELECT COALESCE(SUM(LENGTH(value)), 0) FROM entries').fetchone()[0]
+        return stats
+
+    @staticmethod
+    def _encode(value):
+        return zlib.compress(json.dumps(value).encode('utf-8'), 6)
+
+    @staticmethod
+    def _decode(data):
+        return json.loads(zlib.decompress(data).decode('utf-8'))
+
+class NullCache(MemoryCache):
+    """Cache that never stores anything."""
+
+    def __init__(self):
+        super().__init__(0, 0)
+
+    def get(self, key, max_age = None):
+        return super().get(key)
+
+    def set(self, key, value):
+        pass
+
+    def stats(self):
+        stats = super().stats()
+        stats['backend'] = 'none'
+        return stats
+
+# Guards the creation of the cache.
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Gets the cache configured for the project."""
+    with _cache_lock:
+        if hasattr(get_cache, 'cache'):
+            return get_cache.cache
+
+        config = read_config().get('cache', {})
+        backend = config.get('backend', 'disk')
+        size = config.get('size', 1024)
+        ttl = config.get('ttl', 300)
+
+        if backend == 'disk':
+            get_cache.cache = DiskCache(
+                project_path(config.get('path', 'cache.db')), size, ttl)
+        elif backend == 'none':
+            get_cache.cache = NullCache()
+        else:
+            get_cache.cache = MemoryCache(size, ttl)
+
+        return get_cache.cache
+
+def get_info_cache():
+    """Gets the cache of the info extracted by yt-dlp."""
+    with _cache_lock:
+        if hasattr(get_info_cache, 'cache'):
+            return get_info_cache.cache
+
+        config = read_config().get('info_cache', {})
+        if config.get('enabled', True):
+            get_info_cache.cache = InfoCache(
+                project_path(config.get('path', 'info_cache.db')),
+                config.get('size', 10000), config.get('ttl', 604800))
+        else:
+            get_info_cache.cache = NullCache()
+
+        return get_info_cache.cache
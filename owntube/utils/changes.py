@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""Recording of the changes made to the items in the change log that mirrors
+sync from."""
+
+from owntube.utils.commonutils import batched, db_dialect
+
+def record_changes(cur, kind, keys, deleted = False):
+    """Logs that items of a kind changed or were deleted, using the cursor
+    that changed them so it happens in the same transaction. Each item keeps a
+    single entry, which is moved to the end of the log. The sequence numbers
+    are taken from a counter that stays locked until the transaction commits,
+    so this should be the last thing the transaction does."""
+    keys = list(dict.fromkeys(str(key) for key in keys if key is not None))
+    if len(keys) == 0:
+        return
+
+    dialect = db_dialect()
+    seq = _take_seqs(cur, dialect, len(keys)) - len(keys)
+    for chunk in batched(keys, 500):
+        params = []
+        for key in chunk:
+            seq += 1
+            params += [kind, key, seq, deleted]
+
+        cur.execute('INSERT INTO changes(kind, item, seq, deleted, '
+                    'changed_at) VALUES ' +
+                    ', '.join([f'(%s, %s, %s, %s, {dialect.NOW})'] *
+                              len(chunk)) + ' ' +
+                    dialect.replace_columns(('seq', 'deleted', 'changed_at')),
+                    params)
+
+def _take_seqs(cur, dialect, count):
+    """Takes a number of sequence numbers from the counter, returning the last
+    one of them."""
+    if dialect.UPDATE_RETURNING:
+        cur.execute('UPDATE change_counter SET seq = seq + %s RETURNING seq',
+                    [count])
+        return cur.fetchone()[0]
+
+    cur.execute('UPDATE change_counter SET seq = LAST_INSERT_ID(seq + %s)',
+                [count])
+    return cur.lastrowid
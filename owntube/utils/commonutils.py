@@ -1,11 +1,19 @@
 #!/usr/bin/env python3
 """A collection of common utility functions to help us out."""
 
+from itertools import islice
 from os.path import abspath, dirname
+import threading
 
-import mysql.connector
-import requests
 import yaml
+from flask import g, has_app_context
+
+from owntube.utils.dbpool import ConnectionPool, ThreadConnection
+from owntube.exceptions import UnsupportedDatabase
+
+# Connections held by threads outside of a request.
+_pool_lock = threading.Lock()
+_thread_conn = threading.local()
 
 def read_config(path = None):
     """Reads the default configuration file or a specific one."""
@@ -20,28 +28,84 @@ def read_config(path = None):
 
     return read_config.config
 
-def db_connect():
-    """Connects to the database using the project default configuration file."""
+def project_path(path):
+    """Resolves a path from the configuration against the root of the
+    project, so that every script finds the same files no matter where it's
+    run from."""
+    if path.startswith('/'):
+        return path
+
+    return dirname(dirname(dirname(abspath(__file__)))) + '/' + path
+
+def open_pool(db):
+    """Creates a connection pool for the database described by a db section
+    of the configuration."""
+    backend = db.get('backend', 'mysql')
+    if backend == 'sqlite':
+        # Imported here so that MySQL installs never have to load it.
+        from owntube.utils.sqlite import SQLitePool
+
+        return SQLitePool(project_path(db.get('path', 'owntube.db')), size=db.get('pool_size', 5),
+                          timeout=db.get('pool_timeout', 30),
+                          pragmas=db.get('pragmas'))
+    elif backend != 'mysql':
+        raise UnsupportedDatabase(f'Unknown database backend {backend}')
+
+    return ConnectionPool(
+        size=db.get('pool_size', 5),
+        timeout=db.get('pool_timeout', 30),
+        health_interval=db.get('health_check_interval', 60),
+        prepared=db.get('prepared_statements', True),
+        user=db['user'],
+        password=db['password'],
+        host=db['host'],
+        port=db['port'],
+        database=db['database'])
+
+def db_pool():
+    """Gets the database connection pool of the project."""
     config = read_config()
 
-    # Check if we have already cached the database connection.
-    if not hasattr(db_connect, 'conn'):
-        db_connect.conn = mysql.connector.connect(
-            user=config['db']['user'],
-            password=config['db']['password'],
-            host=config['db']['host'],
-            port=config['db']['port'],
-            database=config['db']['database'])
-        db_connect.conn.autocommit = True
-
-    return db_connect.conn
-
-def download_image(url, path):
-    """Downloads an image from an URL to the specified path."""
-    req = requests.get(url, stream=True)
-    req.raise_for_status()
-
-    # Write the image out.
-    with open(path, 'wb') as fh:
-        for chunk in req.iter_content(1024):
-            fh.write(chunk)
+    # Check if we have already created the connection pool.
+    with _pool_lock:
+        if hasattr(db_pool, 'pool'):
+            return db_pool.pool
+
+        db_pool.pool = open_pool(config['db'])
+        return db_pool.pool
+
+def db_dialect():
+    """Gets the flavour of SQL spoken by the database of the project."""
+    return db_pool().dialect
+
+def db_connect():
+    """Gets the database connection of the current request or thread."""
+    # Requests hold on to a connection until their context is torn down.
+    if has_app_context():
+        if 'db_conn' not in g:
+            g.db_conn = db_pool().acquire()
+        return g.db_conn
+
+    # Everything else holds on to one for as long as the thread lives.
+    if not hasattr(_thread_conn, 'holder') or _thread_conn.holder.conn is None:
+        _thread_conn.holder = ThreadConnection(db_pool())
+    return _thread_conn.holder.conn
+
+def db_release(exc = None):
+    """Returns the connection of the current request or thread to the pool."""
+    if has_app_context():
+        conn = g.pop('db_conn', None)
+        if conn is not None:
+            db_pool().release(conn)
+    elif hasattr(_thread_conn, 'holder'):
+        _thread_conn.holder.release()
+
+def batched(iterable, size):
+    """Splits an iterable into lists of at most size items."""
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, size))
+        if len(batch) == 0:
+            return
+
+        yield batch
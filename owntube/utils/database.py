@@ -1,15 +1,29 @@
 #!/usr/bin/env python3
 
+import threading
 from abc import ABC, abstractmethod
+from functools import lru_cache
 
-from owntube.utils.commonutils import db_connect
+from owntube.utils.cache import get_cache
+from owntube.utils.changes import record_changes
+from owntube.utils.commonutils import db_connect, db_dialect, read_config
+from owntube.utils.queries import Template, execute
 
 class DatabaseItem(ABC):
     """Abstracts the relationship between objects and database items."""
 
-    def __init__(self, table):
-        self.conn = db_connect()
-        self.table = table
+    # Keep instances small since listings build lots of them.
+    __slots__ = ()
+
+    # Table of the objects and its columns in the order that _from_row expects
+    # them.
+    TABLE = None
+    COLUMNS = ()
+
+    @property
+    def conn(self):
+        """Database connection of the current request or thread."""
+        return db_connect()
 
     @abstractmethod
     def from_id(self, id):
@@ -23,29 +37,145 @@ class DatabaseItem(ABC):
     def _from_row(self, row):
         """Populates an object using a database row."""
 
+    @classmethod
+    def _select_columns(cls, table):
+        """Builds the column list of a SELECT statement for this object."""
+        return ', '.join(f'{table}.{col}' for col in cls.COLUMNS)
+
     def _fetch_by_id(self, column, id):
         """Fetches an object from the database via its ID column."""
-        with self.conn.cursor() as cur:
-            cur.execute(f'SELECT * FROM {self.table} WHERE {column} = %s', [id])
-            return cur.fetchone()
+        rows = self._query(_by_id_template(type(self), column).bind(
+            { column: [id] }))
+        try:
+            return next(rows, None)
+        finally:
+            rows.close()
+
+    def _query(self, query):
+        """Iterates over the typed rows of a query built from a template using
+        a prepared statement."""
+        return execute(self.conn, query)
+
+    def _iter_rows(self, stmt, params):
+        """Iterates over the rows of a query without buffering all of them."""
+        conn = self.conn
+        with conn.cursor() as cur:
+            cur.execute(stmt, params)
+            try:
+                for row in cur:
+                    yield row
+            finally:
+                # Don't leave results behind if we were stopped halfway.
+                if conn.unread_result:
+                    conn.consume_results()
 
     @abstractmethod
     def save(self):
         """Commits changes made to the object to the database."""
 
+    @abstractmethod
+    def _params(self):
+        """Column values of the object as they should be committed."""
+
     def _commit(self, params):
         """Inserts or updates a database item parameters automagically."""
-        # Prepare the SQL statement.
-        statement = f'INSERT INTO {self.table}({", ".join(params)}) VALUES ' \
-                    f'({"%s, " * (len(params) - 1)}%s) ON DUPLICATE KEY UPDATE '
-        for col in list(params)[:-1]:
-            statement += f'{col} = %s, '
-        statement += f'{list(params)[-1]} = %s'
-
-        # Commit the changes to the database.
-        with self.conn.cursor() as cur:
-            values = list(params.values()) + list(params.values())
-            cur.execute(statement, values)
+        key = next(iter(params.values()))
+        conn = self.conn
+        conn.start_transaction()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(_upsert_statement(db_dialect(), self.TABLE,
+                                              tuple(params), 1),
+                            list(params.values()))
+                if key is None:
+                    # The ID was given to us by the database.
+                    key = cur.lastrowid or None
+                self._saving(cur, [params])
+
+                # Let the mirrors know about it.
+                record_changes(cur, self.TABLE, [key])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        # Invalidate anything cached from the table or row.
+        get_cache().bump([self.TABLE, f'{self.TABLE}:{key}'])
+        _remember_ids(self.TABLE, [key])
+
+    def _remove(self, key, dependents = ()):
+        """Deletes a database item and everything that depends on it, leaving
+        tombstones behind for the mirrors. The dependents are pairs of the
+        table of the items that get deleted along with ours and a query that
+        selects their IDs given our ID."""
+        conn = self.conn
+        conn.start_transaction()
+        try:
+            with conn.cursor() as cur:
+                deleted = []
+                for table, stmt in dependents:
+                    cur.execute(stmt, [key])
+                    deleted.append((table, [row[0] for row in cur.fetchall()]))
+                cur.execute(f'DELETE FROM {self.TABLE} '
+                            f'WHERE {self.COLUMNS[0]} = %s', [key])
+
+                for table, ids in deleted:
+                    record_changes(cur, table, ids, True)
+                record_changes(cur, self.TABLE, [key], True)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        # Invalidate anything cached from the tables or row.
+        get_cache().bump([self.TABLE, f'{self.TABLE}:{key}'] +
+                         [table for table, stmt in dependents])
+        _forget_ids(self.TABLE, [key])
+        for table, ids in deleted:
+            _forget_ids(table, ids)
+
+    @staticmethod
+    def save_many(items, batch_size = None):
+        """Commits a list of objects using multi-row statements and a single
+        transaction."""
+        if len(items) == 0:
+            return
+        if batch_size is None:
+            batch_size = read_config()['settings'].get('batch_size', 500)
+
+        # Gather up the values to be committed.
+        table = items[0].TABLE
+        rows = [item._params() for item in items]
+        columns = tuple(rows[0])
+
+        # Commit them in batches.
+        keys = [next(iter(row.values())) for row in rows]
+        conn = items[0].conn
+        conn.start_transaction()
+        try:
+            with conn.cursor() as cur:
+                for i in range(0, len(rows), batch_size):
+                    batch = rows[i:i + batch_size]
+                    cur.execute(_upsert_statement(db_dialect(), table,
+                                                  columns, len(batch)),
+                                [value for row in batch
+                                 for value in row.values()])
+                items[0]._saving(cur, rows)
+                record_changes(cur, table, keys)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        # Invalidate anything cached from the table or rows.
+        get_cache().bump([table] + [f'{table}:{key}' for key in keys])
+        _remember_ids(table, keys)
+
+    @classmethod
+    def _saving(cls, cur, rows):
+        """Called with the cursor of the transaction that is committing items
+        and their column values, so that anything derived from them can be
+        brought up to date along with them."""
 
     @abstractmethod
     def exists(self):
@@ -54,6 +184,91 @@ class DatabaseItem(ABC):
     def _check_exists(self, column, value):
         """Checks if an item exists based on a column and its value."""
         with self.conn.cursor() as cur:
-            cur.execute(f'SELECT EXISTS(SELECT {column} FROM {self.table} '
+            cur.execute(f'SELECT EXISTS(SELECT {column} FROM {self.TABLE} '
                         f'WHERE {column} = %s)', [value])
-            return cur.fetchone()[0] == 0
+            return cur.fetchone()[0] == 1
+
+    @classmethod
+    def existing_ids(cls, ids):
+        """Gets which of the IDs are already in the database. IDs that are in
+        the warmed up set are taken for granted, since items deleted through
+        _remove are dropped from it, and the rest are looked up in chunks."""
+        ids = set(ids)
+        with _known_ids_lock:
+            known = _known_ids.get(cls.TABLE)
+            existing = ids & known if known is not None else set()
+        lookup = list(ids - existing)
+        if len(lookup) == 0:
+            return existing
+
+        chunk_size = read_config()['settings'].get('exists_chunk_size', 1000)
+        found = set()
+        with db_connect().cursor() as cur:
+            for i in range(0, len(lookup), chunk_size):
+                chunk = lookup[i:i + chunk_size]
+                cur.execute(f'SELECT {cls.COLUMNS[0]} FROM {cls.TABLE} '
+                            f'WHERE {cls.COLUMNS[0]} IN '
+                            f'({", ".join(["%s"] * len(chunk))})', chunk)
+                found.update(row[0] for row in cur.fetchall())
+
+        _remember_ids(cls.TABLE, found)
+        return existing | found
+
+    @classmethod
+    def diff_new(cls, ids):
+        """Gets the IDs that aren't in the database yet, without duplicates and
+        in their original order."""
+        existing = cls.existing_ids(ids)
+        new = []
+        for id in ids:
+            if id not in existing:
+                existing.add(id)
+                new.append(id)
+
+        return new
+
+    @classmethod
+    def warm_ids(cls):
+        """Loads every ID of the table into memory so that existence checks
+        only have to ask the database about IDs that look new."""
+        with db_connect().cursor() as cur:
+            cur.execute(f'SELECT {cls.COLUMNS[0]} FROM {cls.TABLE}')
+            ids = set(row[0] for row in cur)
+
+        with _known_ids_lock:
+            _known_ids.setdefault(cls.TABLE, set()).update(ids)
+
+# IDs known to be in the database by table, only for the tables that have been
+# warmed up.
+_known_ids = {}
+_known_ids_lock = threading.Lock()
+
+def _remember_ids(table, ids):
+    """Adds IDs to the warmed up set of a table, if there is one."""
+    with _known_ids_lock:
+        if table in _known_ids:
+            _known_ids[table].update(ids)
+
+def _forget_ids(table, ids):
+    """Drops deleted IDs from the warmed up set of a table, if there is
+    one."""
+    with _known_ids_lock:
+        if table in _known_ids:
+            _known_ids[table].difference_update(ids)
+
+@lru_cache(maxsize=None)
+def _by_id_template(cls, column):
+    """Template that fetches an object via its ID column."""
+    return Template(f'{cls.__name__}Row',
+                    f'SELECT {cls._select_columns(cls.TABLE)} '
+                    f'FROM {cls.TABLE} {{where}}', cls.COLUMNS,
+                    { column: f'{column} = %s' })
+
+@lru_cache(maxsize=256)
+def _upsert_statement(dialect, table, columns, rows):
+    """Builds an upsert statement for a number of rows with the same
+    columns."""
+    values = f'({", ".join(["%s"] * len(columns))})'
+
+    return f'INSERT INTO {table}({", ".join(columns)}) VALUES ' \
+           f'{", ".join([values] * rows)} {dialect.replace_columns(columns)}'
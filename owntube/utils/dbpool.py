@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""A thread-safe pool of database connections."""
+
+import threading
+import time
+
+import mysql.connector
+from mysql.connector import Error as DatabaseError
+
+from owntube.utils import metrics
+from owntube.utils.dialects import MYSQL
+from owntube.exceptions import DatabasePoolExhausted
+
+class ConnectionPool:
+    """Hands out database connections to requests and threads."""
+
+    # Flavour of SQL spoken by the connections.
+    dialect = MYSQL
+
+    def __init__(self, size = 5, timeout = 30, health_interval = 60,
+                 prepared = True, **conn_args):
+        self.size = size
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.prepared = prepared
+        self.conn_args = conn_args
+
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle = []
+        self._statements = {}
+
+        # Metrics.
+        self.opened = 0
+        self.in_use = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+        self.reconnects = 0
+        self.prepares = 0
+
+    def acquire(self):
+        """Checks out a healthy connection from the pool."""
+        # Wait for a free slot if the pool is exhausted.
+        if not self._slots.acquire(blocking=False):
+            start = time.monotonic()
+            acquired = self._slots.acquire(timeout=self.timeout)
+            with self._lock:
+                self.waits += 1
+                self.wait_time += time.monotonic() - start
+                if not acquired:
+                    self.timeouts += 1
+            if not acquired:
+                raise DatabasePoolExhausted()
+
+        # Reuse an idle connection or open a new one.
+        try:
+            with self._lock:
+                idle = self._idle.pop() if len(self._idle) > 0 else None
+            conn = self._check(*idle) if idle is not None else self._open()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+
+        return conn
+
+    def release(self, conn):
+        """Returns a connection to the pool."""
+        try:
+            # Make sure we don't leak a result or transaction to the next user.
+            if conn.unread_result:
+                conn.consume_results()
+            if conn.in_transaction:
+                conn.rollback()
+            healthy = conn.is_connected()
+        except DatabaseError:
+            healthy = False
+
+        with self._lock:
+            self.in_use -= 1
+            if healthy:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self.opened -= 1
+                self._statements.pop(conn, None)
+        self._slots.release()
+
+    def statement(self, conn, stmt):
+        """Gets the server-side prepared statement of a connection for a
+        statement, preparing it the first time it's used. Returns None if
+        prepared statements are disabled."""
+        if not self.prepared:
+            return None
+
+        with self._lock:
+            statements = self._statements.setdefault(conn, {})
+        if stmt not in statements:
+            statements[stmt] = conn.cursor(prepared=True)
+            with self._lock:
+                self.prepares += 1
+
+        return statements[stmt]
+
+    def forget(self, conn):
+        """Closes and drops the prepared statements of a connection."""
+        with self._lock:
+            statements = self._statements.pop(conn, {})
+
+        for cur in statements.values():
+            try:
+                cur.close()
+            except DatabaseError:
+                pass
+
+    def stats(self):
+        """Metrics about the usage of the pool."""
+        with self._lock:
+            return {
+                'size': self.size,
+                'open': self.opened,
+                'in_use': self.in_use,
+                'idle': len(self._idle),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_time': round(self.wait_time, 6),
+                'timeouts': self.timeouts,
+                'reconnects': self.reconnects,
+                'prepared_statements': self.prepares
+            }
+
+    def _open(self):
+        """Opens a brand new connection to the database."""
+        conn = TimedConnection(mysql.connector.connect(**self.conn_args))
+        conn.autocommit = True
+
+        with self._lock:
+            self.opened += 1
+
+        return conn
+
+    def _check(self, conn, last_used):
+        """Ensures an idle connection is still alive, reconnecting if needed."""
+        if time.monotonic() - last_used < self.health_interval:
+            return conn
+
+        # The statements prepared on the server would be lost if it
+        # reconnects, so start afresh.
+        self.forget(conn)
+
+        try:
+            conn.ping(reconnect=True, attempts=3, delay=1)
+            conn.autocommit = True
+            return conn
+        except DatabaseError:
+            # Give up on it and start afresh.
+            with self._lock:
+                self.opened -= 1
+                self.reconnects += 1
+            return self._open()
+
+class TimedConnection:
+    """Wraps a connection so that the statements executed by its cursors are
+    accounted for in the metrics."""
+
+    __slots__ = ('_conn',)
+
+    def __init__(self, conn):
+        object.__setattr__(self, '_conn', conn)
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+class TimedCursor:
+    """Cursor that times the statements it executes. Unbuffered results are
+    only timed until the server starts sending rows."""
+
+    __slots__ = ('_cur',)
+
+    def __init__(self, cur):
+        self._cur = cur
+
+    def execute(self, operation, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cur.execute(operation, *args, **kwargs)
+        finally:
+            metrics.record_query(operation, time.perf_counter() - start)
+
+    def executemany(self, operation, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cur.executemany(operation, *args, **kwargs)
+        finally:
+            metrics.record_query(operation, time.perf_counter() - start)
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cur.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+class ThreadConnection:
+    """Holds on to a connection for the lifetime of a thread."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.conn = pool.acquire()
+
+    def release(self):
+        """Returns the connection to the pool."""
+        if self.conn is not None:
+            self.pool.release(self.conn)
+            self.conn = None
+
+    def __del__(self):
+        self.release()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""The bits of SQL that differ between the supported databases."""
+
+class MySQLDialect:
+    """SQL as spoken by MySQL and MariaDB."""
+
+    name = 'mysql'
+
+    # Inserts rows unless they would be duplicates.
+    INSERT_IGNORE = 'INSERT IGNORE'
+
+    # Whether UPDATE statements can return the rows they changed.
+    UPDATE_RETURNING = False
+
+    # Locks the rows read by a SELECT until the end of the transaction.
+    FOR_UPDATE = ' FOR UPDATE'
+
+    # Current local time of the database.
+    NOW = 'NOW()'
+
+    # Local time a number of seconds (given as a parameter) from now.
+    SECONDS_FROM_NOW = 'NOW() + INTERVAL %s SECOND'
+
+    def new_value(self, column):
+        """Refers to the value that was about to be inserted in an upsert."""
+        return f'VALUES({column})'
+
+    def on_duplicate(self, assignments):
+        """Clause that turns an INSERT into an upsert, applying the
+        assignments to the existing row when any unique key is taken."""
+        return f'ON DUPLICATE KEY UPDATE {", ".join(assignments)}'
+
+    def replace_columns(self, columns):
+        """Upsert clause that overwrites the columns with the new values."""
+        return self.on_duplicate(f'{col} = {self.new_value(col)}'
+                                 for col in columns)
+
+    def analyze(self, tables):
+        """Statements that refresh the statistics of the query planner."""
+        return [f'ANALYZE TABLE {", ".join(tables)}']
+
+class SQLiteDialect(MySQLDialect):
+    """SQL as spoken by SQLite 3.35 or newer."""
+
+    name = 'sqlite'
+
+    INSERT_IGNORE = 'INSERT OR IGNORE'
+    UPDATE_RETURNING = True
+    # Transactions already hold the write lock of the whole database.
+    FOR_UPDATE = ''
+    NOW = "datetime('now', 'localtime')"
+    SECONDS_FROM_NOW = "datetime('now', 'localtime', %s || ' seconds')"
+
+    def new_value(self, column):
+        return f'excluded.{column}'
+
+    def on_duplicate(self, assignments):
+        # Leaving out the conflict target makes it apply to any unique key,
+        # just like MySQL does.
+        return f'ON CONFLICT DO UPDATE SET {", ".join(assignments)}'
+
+    def analyze(self, tables):
+        return ['ANALYZE', 'PRAGMA optimize']
+
+# Instances of the dialects, which hold no state.
+MYSQL = MySQLDialect()
+SQLITE = SQLiteDialect()
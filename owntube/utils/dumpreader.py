@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""Incremental reader of the subscription dumps made with ytdump."""
+
+import json
+
+class DumpReader:
+    """Reads a channel dump without loading all of its videos into memory.
+
+    Both the JSON dumps (a single object with the videos as its last key) and
+    the JSON lines dumps (the channel on the first line followed by one video
+    per line) are supported. Use it as a context manager and iterate over
+    `videos` after reading `channel`.
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.fh = None
+        self.channel = None
+        self.videos = None
+
+    def __enter__(self):
+        self.fh = open(self.fname, 'r')
+
+        if self.fname.endswith('.jsonl'):
+            self.channel = json.loads(self.fh.readline())
+            self.videos = (json.loads(line) for line in self.fh
+                           if line.strip() != '')
+        else:
+            self.channel, self.videos = _JSONStream(self.fh).channel()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.fh.close()
+
+class _JSONStream:
+    """Pulls JSON values out of a file one at a time."""
+
+    # Number of characters to read from the file at once.
+    CHUNK_SIZE = 65536
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def channel(self):
+        """Reads the channel object up to its list of videos."""
+        channel = {}
+
+        self.expect('{')
+        if self.peek() == '}':
+            return channel, iter(())
+
+        while True:
+            key = self.value()
+            self.expect(':')
+            if key == 'videos':
+                return channel, self.array()
+            channel[key] = self.value()
+
+            if self.next() == '}':
+                return channel, iter(())
+
+    def array(self):
+        """Yields the items of an array one by one."""
+        if self.peek() == 'n':
+            self.value()
+            return
+
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+
+        while True:
+            yield self.value()
+            if self.next() == ']':
+                return
+
+    def value(self):
+        """Decodes the next value in the stream."""
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+
+                # Make sure a number wasn't cut short by the end of the buffer.
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+
+            self._fill()
+
+    def peek(self):
+        """Gets the next non-whitespace character without consuming it."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+
+            if not self._fill():
+                raise ValueError(f'Unexpected end of dump {self.fh.name}')
+
+    def next(self):
+        """Consumes the next non-whitespace character."""
+        char = self.peek()
+        self.pos += 1
+
+        return char
+
+    def expect(self, char):
+        """Consumes the next non-whitespace character ensuring it's the one we
+        expected."""
+        if self.next() != char:
+            raise ValueError(f'Expected {char!r} at position {self.pos} of '
+                             f'the dump {self.fh.name}')
+
+    def _fill(self):
+        """Reads more of the file into the buffer."""
+        chunk = self.fh.read(self.CHUNK_SIZE)
+        if chunk == '':
+            self.eof = True
+            return False
+
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+
+        return True
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""Shared HTTP fetch engine running on its own event loop."""
+
+import importlib.util
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from owntube.utils import metrics
+from owntube.utils.commonutils import read_config
+from owntube.exceptions import FetchError
+
+class FetchEngine:
+    """Pooled asynchronous HTTP client with per-host concurrency limits,
+    timeouts and retries. Synchronous code uses fetch and fetch_many, which
+    hand the work over to the engine's event loop thread."""
+
+    # Responses that are worth trying again.
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+
+    _shared = None
+    _lock = threading.Lock()
+
+    def __init__(self, max_connections = 100, per_host = 8, timeout = 10,
+                 retries = 3, backoff = 0.5, http2 = True):
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+        # Like the HTTP client, the event loop machinery is only loaded once
+        # an engine is needed.
+        import asyncio
+
+        # HTTP/2 is only available if the h2 package is installed.
+        self.http2 = http2 and importlib.util.find_spec('h2') is not None
+
+        self._hosts = {}
+        self._client = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever,
+                                        name='fetch-engine', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def shared(cls):
+        """Gets the engine of the process, configured by the http section of
+        the configuration."""
+        with cls._lock:
+            if cls._shared is None:
+                config = read_config().get('http', {})
+                cls._shared = FetchEngine(
+                    max_connections=config.get('max_connections', 100),
+                    per_host=config.get('per_host', 8),
+                    timeout=config.get('timeout', 10),
+                    retries=config.get('retries', 3),
+                    backoff=config.get('backoff', 0.5),
+                    http2=config.get('http2', True))
+
+            return cls._shared
+
+    def fetch(self, url, headers = None, timeout = None):
+        """Fetches a URL, retrying on network errors and server hiccups.
+        Returns the response with its body already read, whatever its status
+        code, or raises a FetchError if the server couldn't be reached or the
+        request couldn't be made at all."""
+        return self._run(self.fetch_async(url, headers, timeout))
+
+    def fetch_many(self, requests, limit = None, timeout = None):
+        """Fetches a list of (url, headers) pairs concurrently, with at most
+        limit of them in flight. Returns a list with the response or the
+        FetchError of each request in the same order."""
+        return self._run(self._gather(requests, limit, timeout))
+
+    def close(self):
+        """Closes the pooled connections and stops the event loop."""
+        if self._client is not None:
+            self._run(self._client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    async def fetch_async(self, url, headers = None, timeout = None):
+        """Fetches a URL from within the event loop."""
+        # The HTTP client is only loaded once something is actually fetched,
+        # which web workers rarely do.
+        import asyncio
+        import httpx
+
+        try:
+            host = urlsplit(url).netloc
+        except ValueError as err:
+            raise FetchError(f'Failed to fetch {url}: {err!r}')
+
+        client = self._get_client()
+        semaphore = self._host_semaphore(host)
+        timeout = self.timeout if timeout is None else timeout
+
+        attempt = 0
+        while True:
+            try:
+                async with semaphore:
+                    start = time.perf_counter()
+                    resp = await client.get(url, headers=headers,
+                                            timeout=timeout)
+                metrics.FETCH_DURATION.observe(time.perf_counter() - start,
+                                               host=host,
+                                               status=resp.status_code)
+                if resp.status_code not in self.RETRY_STATUS or \
+                        attempt >= self.retries:
+                    return resp
+                delay = self._retry_after(resp, attempt)
+            except httpx.TransportError as err:
+                metrics.FETCH_DURATION.observe(time.perf_counter() - start,
+                                               host=host, status='error')
+                if attempt >= self.retries:
+                    raise FetchError(f'Failed to fetch {url}: {err!r}')
+                delay = self.backoff * 2 ** attempt
+            except (httpx.HTTPError, httpx.InvalidURL) as err:
+                # Redirect loops, undecodable bodies and bad URLs won't get
+                # any better by trying again.
+                metrics.FETCH_DURATION.observe(time.perf_counter() - start,
+                                               host=host, status='error')
+                raise FetchError(f'Failed to fetch {url}: {err!r}')
+
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _gather(self, requests, limit, timeout):
+        """Fetches a list of requests concurrently."""
+        import asyncio
+        semaphore = asyncio.Semaphore(limit or len(requests) or 1)
+
+        async def fetch(url, headers):
+            async with semaphore:
+                try:
+                    return await self.fetch_async(url, headers, timeout)
+                except FetchError as err:
+                    return err
+
+        return await asyncio.gather(*(fetch(url, headers)
+                                      for url, headers in requests))
+
+    def _run(self, coro):
+        """Runs a coroutine on the engine's loop and waits for its result."""
+        import asyncio
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def _get_client(self):
+        """Gets the pooled client, creating it inside the event loop."""
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                http2=self.http2, follow_redirects=True,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=
+                                    self.max_connections))
+
+        return self._client
+
+    def _host_semaphore(self, host):
+        """Gets the semaphore that limits the concurrent requests to a
+        host."""
+        import asyncio
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host)
+
+        return self._hosts[host]
+
+    def _retry_after(self, resp, attempt):
+        """Figures out how long to wait before retrying a request."""
+        value = resp.headers.get('Retry-After')
+        if value is not None:
+            try:
+                return min(float(value), 60)
+            except ValueError:
+                try:
+                    delay = parsedate_to_datetime(value) - \
+                        datetime.now(timezone.utc)
+                    return min(max(delay.total_seconds(), 0), 60)
+                except (TypeError, ValueError):
+                    pass
+
+        return self.backoff * 2 ** attempt
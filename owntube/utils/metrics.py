@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""In-process performance metrics rendered in the Prometheus text format."""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_app_context
+
+# Default histogram buckets in seconds.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+                   10, 30, 60)
+
+# Maximum number of statements remembered for the slow request log.
+MAX_LOGGED_QUERIES = 200
+
+# Every metric that has been created, in the order they were.
+_registry = []
+
+class Metric:
+    """Base of the metrics, which keep a value for each set of labels."""
+
+    TYPE = None
+
+    def __init__(self, name, help, labels = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+        _registry.append(self)
+
+    def render(self):
+        """Renders the metric in the Prometheus text format."""
+        lines = [f'# HELP {self.name} {self.help}',
+                 f'# TYPE {self.name} {self.TYPE}']
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines += self._render_value(dict(zip(self.labels, key)), value)
+
+        return lines
+
+    def _key(self, labels):
+        """Turns the labels of a sample into the key of its value."""
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _render_value(self, labels, value):
+        return [f'{self.name}{format_labels(labels)} {value}']
+
+class Counter(Metric):
+    """A value that only goes up."""
+
+    TYPE = 'counter'
+
+    def inc(self, amount = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets."""
+
+    TYPE = 'histogram'
+
+    def __init__(self, name, help, labels = (), buckets = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = [[0] * len(self.buckets), 0, 0.0]
+            counts, count, total = self.values[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key][1] = count + 1
+            self.values[key][2] = total + value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes how long the body of a with statement takes."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_value(self, labels, value):
+        counts, count, total = value
+        lines = []
+        for bound, bucket in zip(self.buckets, counts):
+            lines.append(f'{self.name}_bucket'
+                         f'{format_labels(dict(labels, le=bound))} {bucket}')
+        lines.append(f'{self.name}_bucket'
+                     f'{format_labels(dict(labels, le="+Inf"))} {count}')
+        lines.append(f'{self.name}_count{format_labels(labels)} {count}')
+        lines.append(f'{self.name}_sum{format_labels(labels)} {total}')
+
+        return lines
+
+def format_labels(labels):
+    """Formats a set of labels of a sample."""
+    if len(labels) == 0:
+        return ''
+
+    pairs = []
+    for name, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"') \
+            .replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+
+    return '{' + ','.join(pairs) + '}'
+
+def render_all():
+    """Renders every metric in the Prometheus text format."""
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+
+    return lines
+
+# Metrics of the requests.
+REQUEST_DURATION = Histogram(
+    'owntube_request_duration_seconds', 'Time spent handling requests.',
+    ('endpoint', 'method', 'status'))
+REQUEST_QUERIES = Histogram(
+    'owntube_request_db_queries', 'Database queries issued per request.',
+    ('endpoint',), (0, 1, 2, 5, 10, 20, 50, 100, 500, 1000))
+REQUEST_QUERY_TIME = Histogram(
+    'owntube_request_db_seconds', 'Time spent in the database per request.',
+    ('endpoint',))
+
+# Metrics of the calls that we make to other things.
+QUERY_DURATION = Histogram(
+    'owntube_db_query_duration_seconds', 'Time spent executing statements.',
+    ('statement',))
+FETCH_DURATION = Histogram(
+    'owntube_http_fetch_duration_seconds', 'Time spent fetching URLs.',
+    ('host', 'status'))
+YTDLP_DURATION = Histogram(
+    'owntube_ytdlp_duration_seconds', 'Time spent in YoutubeDL calls.',
+    ('operation',))
+
+def record_query(stmt, elapsed):
+    """Accounts for a statement executed on the database."""
+    verb = stmt.lstrip().split(None, 1)[0].upper() if stmt.strip() else '?'
+    QUERY_DURATION.observe(elapsed, statement=verb)
+
+    # Keep track of the queries of the current request.
+    if has_app_context() and 'db_queries' in g:
+        g.db_queries += 1
+        g.db_time += elapsed
+        if len(g.db_log) < MAX_LOGGED_QUERIES:
+            g.db_log.append((stmt, elapsed))
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""Versioned database schema migrations and checks of the query plans."""
+
+import re
+from glob import glob
+from os.path import abspath, basename, dirname
+
+from owntube.utils.commonutils import batched, db_connect, db_pool
+
+# Default location of the migration files. The ones for SQLite are in a
+# folder of their own and share the version numbers of the MySQL ones.
+MIGRATIONS_DIR = dirname(dirname(dirname(abspath(__file__)))) + \
+    '/sql/migrations'
+
+# Tables with data worth copying between databases, in an order that keeps
+# their foreign keys happy.
+TABLES = ('channels', 'videos', 'downloaded_videos', 'metadata_queue',
+          'feed_state', 'download_jobs', 'images', 'timeline',
+          'changes', 'change_counter')
+
+# Matches the file names of migrations, such as 0007_listing_indexes.sql.
+_FILENAME_REGEX = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+# Statements of the original initialize.sql that pick the database, which is
+# already chosen by the configuration.
+_DATABASE_REGEX = re.compile(r'^\s*(CREATE\s+DATABASE|USE)\s', re.IGNORECASE)
+
+def split_statements(sql):
+    """Splits a migration script into its statements, ignoring comments. Each
+    statement must end with a semicolon at the end of a line, and triggers
+    with an END; line of their own."""
+    statements = []
+    current = []
+    for line in sql.splitlines():
+        if line.strip().startswith('--') or line.strip() == '':
+            continue
+
+        current.append(line)
+        if current[0].lstrip().upper().startswith('CREATE TRIGGER'):
+            if line.strip().upper() == 'END;':
+                statements.append('\n'.join(current).rstrip()[:-1])
+                current = []
+        elif line.rstrip().endswith(';'):
+            statements.append('\n'.join(current).rstrip()[:-1])
+            current = []
+
+    if len(current) > 0:
+        statements.append('\n'.join(current))
+
+    return statements
+
+class Migrator:
+    """Applies the migrations that haven't been applied to the database yet,
+    keeping track of them in the schema_migrations table."""
+
+    def __init__(self, path = None, pool = None):
+        """Works on the database of the project unless a connection pool of
+        another one is given."""
+        if pool is None:
+            pool = db_pool()
+            self.conn = db_connect()
+        else:
+            self.conn = pool.acquire()
+
+        self.dialect = pool.dialect
+        self.path = path or (MIGRATIONS_DIR if self.dialect.name == 'mysql'
+                             else f'{MIGRATIONS_DIR}/{self.dialect.name}')
+
+    def migrations(self):
+        """Gets every available migration as (version, name, path) sorted by
+        version."""
+        found = []
+        for path in glob(f'{self.path}/*.sql'):
+            match = _FILENAME_REGEX.match(basename(path))
+            if match is not None:
+                found.append((int(match.group(1)), match.group(2), path))
+
+        return sorted(found)
+
+    def applied(self):
+        """Gets the versions that have already been applied."""
+        self._ensure_table()
+        with self.conn.cursor() as cur:
+            cur.execute('SELECT version FROM schema_migrations')
+            return set(row[0] for row in cur.fetchall())
+
+    def pending(self):
+        """Gets the migrations that still have to be applied."""
+        applied = self.applied()
+        return [migration for migration in self.migrations()
+                if migration[0] not in applied]
+
+    def migrate(self, target = None):
+        """Applies the pending migrations up to a target version in order and
+        returns the ones that were applied."""
+        done = []
+        for version, name, path in self.pending():
+            if target is not None and version > target:
+                break
+
+            with open(path, 'r') as fh:
+                statements = split_statements(fh.read())
+
+            # DDL is committed implicitly, so each statement is on its own.
+            with self.conn.cursor() as cur:
+                for stmt in statements:
+                    if _DATABASE_REGEX.match(stmt) is None:
+                        cur.execute(stmt)
+                cur.execute('INSERT INTO schema_migrations(version, name) '
+                            'VALUES (%s, %s)', [version, name])
+            done.append((version, name))
+
+        return done
+
+    def baseline(self, version):
+        """Marks the migrations up to a version as applied without running
+        them, for databases that were created before the migrations."""
+        self._ensure_table()
+        with self.conn.cursor() as cur:
+            cur.executemany(f'{self.dialect.INSERT_IGNORE} INTO '
+                            'schema_migrations(version, name) '
+                            'VALUES (%s, %s)',
+                            [(v, name) for v, name, path in self.migrations()
+                             if v <= version])
+
+    def _ensure_table(self):
+        """Creates the table that keeps track of the migrations."""
+        with self.conn.cursor() as cur:
+            cur.execute('CREATE TABLE IF NOT EXISTS schema_migrations('
+                        'version INT NOT NULL PRIMARY KEY, '
+                        'name VARCHAR(100) NOT NULL, '
+                        'applied_at DATETIME NOT NULL '
+                        'DEFAULT CURRENT_TIMESTAMP)')
+
+def explain_listings():
+    """Runs EXPLAIN on the queries behind the listings and returns the
+    problems found with their plans, which is empty if every one of them reads
+    its page straight from an index. The optimizer may rightly prefer to sort
+    tables that only have a handful of rows, so this is only meaningful on a
+    populated database."""
+    # Imported here to avoid a circular import with the models.
+    from owntube.channel import Channel
+    from owntube.timeline import Timeline
+    from owntube.video import DownloadedVideo, Video
+
+    chan = Channel('UC0000000000000000000000')
+    after = ('2000-01-01 00:00:00', 'zzzzzzzzzzz')
+    queries = {
+        'latest videos': Video()._listing(20, None, None, None),
+        'latest videos page': Video()._listing(20, None, after, None),
+        'channel videos': Video()._listing(20, None, None, chan),
+        'channel videos page': Video()._listing(20, None, after, chan),
+        'channels': Channel()._listing(20, None),
+        'timeline': Timeline._PAGE.bind({}, 20),
+        'timeline page': Timeline._PAGE.bind(
+            { 'after': [after[0], after[0], after[1]] }, 20),
+        'downloads': DownloadedVideo._LIST.bind({ 'vid': ['00000000000'] })
+    }
+
+    problems = []
+    conn = db_connect()
+    with conn.cursor(dictionary=True) as cur:
+        for name, (stmt, params, row) in queries.items():
+            if db_pool().dialect.name == 'sqlite':
+                problems += _explain_sqlite(cur, name, stmt, params)
+                continue
+
+            cur.execute(f'EXPLAIN {stmt}', params)
+            for row in cur.fetchall():
+                extra = row.get('Extra') or ''
+                if 'Using filesort' in extra:
+                    problems.append(f'{name}: sorts the rows of '
+                                    f'{row["table"]}')
+                if row.get('type') == 'ALL':
+                    problems.append(f'{name}: scans every row of '
+                                    f'{row["table"]}')
+
+    return problems
+
+def _explain_sqlite(cur, name, stmt, params):
+    """Finds the problems with the plan of a query on SQLite."""
+    problems = []
+    cur.execute(f'EXPLAIN QUERY PLAN {stmt}', params)
+    for row in cur.fetchall():
+        detail = row['detail']
+        if detail.startswith('USE TEMP B-TREE'):
+            problems.append(f'{name}: sorts the rows ({detail})')
+        elif detail.startswith('SCAN ') and ' INDEX ' not in detail:
+            problems.append(f'{name}: scans every row ({detail})')
+
+    return problems
+
+def copy_database(source, target, batch_size = 1000, progress = None):
+    """Copies the data of every table from the database of a connection pool
+    to the one of another, which must already be migrated to the same
+    version. Rows that are already in the target are overwritten. The progress
+    function is called with the table and number of rows copied after each
+    batch."""
+    src = source.acquire()
+    dst = target.acquire()
+    try:
+        for table in TABLES:
+            # Only copy the columns that both of them know about.
+            known = _columns(dst, table)
+            columns = [col for col in _columns(src, table) if col in known]
+            values = f'({", ".join(["%s"] * len(columns))})'
+            stmt = f'INSERT INTO {table}({", ".join(columns)}) ' \
+                   f'VALUES {values} ' \
+                   f'{target.dialect.replace_columns(columns)}'
+
+            copied = 0
+            with src.cursor() as read:
+                read.execute(f'SELECT {", ".join(columns)} FROM {table}')
+                for batch in batched(read, batch_size):
+                    dst.start_transaction()
+                    try:
+                        with dst.cursor() as write:
+                            write.executemany(stmt, batch)
+                        dst.commit()
+                    except Exception:
+                        dst.rollback()
+                        raise
+
+                    copied += len(batch)
+                    if progress is not None:
+                        progress(table, copied)
+
+        # The planner should know about all of the new rows.
+        with dst.cursor() as cur:
+            for stmt in target.dialect.analyze(TABLES):
+                cur.execute(stmt)
+                if cur.description is not None:
+                    cur.fetchall()
+    finally:
+        source.release(src)
+        target.release(dst)
+
+def _columns(conn, table):
+    """Gets the names of the columns of a table."""
+    with conn.cursor() as cur:
+        cur.execute(f'SELECT * FROM {table} LIMIT 0')
+        cur.fetchall()
+        return [col[0] for col in cur.description]
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""Keyset pagination helpers for the listings."""
+
+import base64
+import json
+
+from owntube.utils.commonutils import read_config
+from owntube.exceptions import InvalidCursor
+
+def default_count(count, since = None):
+    """Ensures the user gets something if the listing isn't bounded."""
+    if count is None and since is None:
+        return read_config()['settings']['video_count']
+
+    return count
+
+def encode_cursor(*key):
+    """Builds an opaque page token out of the sort key of the last item."""
+    return base64.urlsafe_b64encode(
+        json.dumps(key, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+def decode_cursor(token, length):
+    """Gets the sort key back from an opaque page token."""
+    if token is None:
+        return None
+
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise InvalidCursor()
+    if not isinstance(key, list) or len(key) != length or \
+            not all(isinstance(value, str) for value in key):
+        raise InvalidCursor()
+
+    return key
+
+def next_cursor(items, count, cursor = None):
+    """Page token of the next page or None if this is the last one. Listings
+    of plain dictionaries must supply the function that builds the token."""
+    if count is None or len(items) < count or len(items) == 0:
+        return None
+
+    if cursor is not None:
+        return cursor(items[-1])
+    return items[-1].cursor
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Statement templates that run as server-side prepared statements."""
+
+from collections import namedtuple
+
+from mysql.connector import errorcode
+from mysql.connector.errors import DatabaseError
+
+from owntube.utils.commonutils import db_pool
+
+# A statement built from a template, ready to be executed.
+Query = namedtuple('Query', ('stmt', 'params', 'row'))
+
+class Template:
+    """A statement with a fixed set of optional WHERE clauses and an optional
+    LIMIT. Every combination of them always renders to the same text, so each
+    one only has to be prepared once per connection."""
+
+    def __init__(self, name, sql, fields, clauses = None):
+        self.sql = sql
+        self.clauses = clauses or {}
+        self.row = namedtuple(name, fields)
+        self._rendered = {}
+
+    def bind(self, clauses = None, limit = None):
+        """Builds the query with its parameters. The clauses are given as a
+        dictionary of their names and parameters, which may be in any order,
+        and clauses whose parameters are None are left out."""
+        clauses = dict((name, params) for name, params in
+                       (clauses or {}).items() if params is not None)
+        used = tuple(name for name in self.clauses if name in clauses)
+        key = (used, limit is not None)
+        if key not in self._rendered:
+            self._rendered[key] = self._render(*key)
+
+        params = [param for name in used for param in clauses[name]]
+        if limit is not None:
+            params.append(limit)
+
+        return Query(self._rendered[key], params, self.row)
+
+    def _render(self, used, limit):
+        """Renders the statement for a combination of clauses."""
+        where = ''
+        if len(used) > 0:
+            where = 'WHERE ' + ' AND '.join(self.clauses[name]
+                                            for name in used) + ' '
+
+        return self.sql.format(where=where,
+                               limit='LIMIT %s' if limit else '').strip()
+
+def execute(conn, query):
+    """Runs a query using the prepared statement cached for the connection, or
+    a regular cursor if those are disabled, iterating over its typed rows as
+    they arrive."""
+    stmt, params, row = query
+    cur = db_pool().statement(conn, stmt)
+    if cur is None:
+        yield from _execute_text(conn, stmt, params, row)
+        return
+
+    try:
+        cur.execute(stmt, params)
+    except DatabaseError as err:
+        if err.errno != errorcode.ER_UNKNOWN_STMT_HANDLER:
+            raise
+
+        # The server forgot about our statements, so prepare it again.
+        db_pool().forget(conn)
+        cur = db_pool().statement(conn, stmt)
+        cur.execute(stmt, params)
+
+    try:
+        for values in cur:
+            yield _typed(values, row)
+    finally:
+        # The statement can only be executed again once its rows are read.
+        if conn.unread_result:
+            cur.fetchall()
+
+def _execute_text(conn, stmt, params, row):
+    """Runs a statement with a regular unbuffered cursor."""
+    with conn.cursor() as cur:
+        cur.execute(stmt, params)
+        try:
+            for values in cur:
+                yield _typed(values, row)
+        finally:
+            # Don't leave results behind if we were stopped halfway.
+            if conn.unread_result:
+                conn.consume_results()
+
+def _typed(values, row):
+    """Converts the values of a row that come back from the binary protocol
+    as raw bytes and wraps them up in the row type."""
+    values = tuple(value.decode('utf-8') if isinstance(value, bytearray)
+                   else value for value in values)
+    return values if row is None else row._make(values)
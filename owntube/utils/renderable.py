@@ -6,6 +6,8 @@ from abc import ABC, abstractmethod
 class Renderable(ABC):
     """Abstracts an object that can be rendered by the server."""
 
+    __slots__ = ()
+
     def to_json(self, expand=None):
         """JSON representation of the object."""
         return json.dumps(self.__dict__(expand=expand))
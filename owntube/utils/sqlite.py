@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""Embedded SQLite storage backend, for installs that don't want to run a
+database server. Its connections speak the part of the mysql-connector API
+that the project uses, so the models work with either of them."""
+
+import re
+import sqlite3
+from datetime import datetime
+from functools import lru_cache
+
+from owntube.utils.dbpool import ConnectionPool, TimedConnection
+from owntube.utils.dialects import SQLITE
+from owntube.exceptions import UnsupportedDatabase
+
+# Oldest version with RETURNING and upserts without a conflict target.
+MIN_VERSION = (3, 35, 0)
+
+# Settings applied to every connection, which can be overridden with the
+# pragmas of the db section of the configuration.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'foreign_keys': 'ON',
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+    'cache_size': -65536,
+    'mmap_size': 268435456
+}
+
+# Matches the parameter markers of the statements written for MySQL.
+_PARAM_REGEX = re.compile(r'%(s|%)')
+
+# Dates are stored as text in the same format that MySQL uses, which sorts
+# properly, and come back as datetime objects just like they do from MySQL.
+sqlite3.register_adapter(datetime,
+                         lambda value: value.strftime('%Y-%m-%d %H:%M:%S'))
+sqlite3.register_converter('DATETIME', lambda value: datetime.fromisoformat(
+    value.decode('ascii')))
+
+class SQLitePool(ConnectionPool):
+    """Pool of connections to an SQLite database file. WAL mode lets readers
+    carry on while somebody writes, so requests still get connections of
+    their own."""
+
+    dialect = SQLITE
+
+    def __init__(self, path, size = 5, timeout = 30, pragmas = None):
+        if sqlite3.sqlite_version_info < MIN_VERSION:
+            raise UnsupportedDatabase(
+                f'SQLite {sqlite3.sqlite_version} is too old, at least '
+                f'{".".join(map(str, MIN_VERSION))} is required')
+
+        # SQLite caches its statements by itself.
+        super().__init__(size, timeout, prepared=False)
+        self.path = path
+        self.pragmas = dict(DEFAULT_PRAGMAS, **(pragmas or {}))
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout,
+                               detect_types=sqlite3.PARSE_DECLTYPES,
+                               isolation_level=None, check_same_thread=False,
+                               cached_statements=256)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+
+        with self._lock:
+            self.opened += 1
+
+        return TimedConnection(SQLiteConnection(conn))
+
+    def _check(self, conn, last_used):
+        # There's no server that could have gone away.
+        return conn
+
+class SQLiteConnection:
+    """Makes an SQLite connection look like a mysql-connector one."""
+
+    # Results are read straight from the database file, so there's never
+    # anything left to be consumed.
+    unread_result = False
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    @property
+    def autocommit(self):
+        return not self._conn.in_transaction
+
+    @autocommit.setter
+    def autocommit(self, value):
+        # Statements outside of explicit transactions are always committed
+        # right away.
+        pass
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def cursor(self, buffered = None, prepared = None, dictionary = None):
+        return SQLiteCursor(self._conn.cursor(), dictionary)
+
+    def start_transaction(self):
+        """Starts a transaction that holds the write lock right away, so that
+        it can't fail halfway because somebody else started writing."""
+        self._conn.execute('BEGIN IMMEDIATE')
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def consume_results(self):
+        pass
+
+    def is_connected(self):
+        try:
+            self._conn.execute('SELECT 1')
+            return True
+        except sqlite3.ProgrammingError:
+            return False
+
+    def ping(self, reconnect = False, attempts = 1, delay = 0):
+        pass
+
+    def close(self):
+        self._conn.close()
+
+class SQLiteCursor:
+    """Makes an SQLite cursor look like a mysql-connector one."""
+
+    def __init__(self, cur, dictionary = False):
+        self._cur = cur
+        self.dictionary = dictionary
+
+    def execute(self, operation, params = None, multi = False):
+        self._cur.execute(_translate(operation), params or ())
+
+    def executemany(self, operation, seq_params):
+        self._cur.executemany(_translate(operation), seq_params)
+
+    def fetchone(self):
+        return self._row(self._cur.fetchone())
+
+    def fetchmany(self, size = 1):
+        return [self._row(row) for row in self._cur.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cur.fetchall()]
+
+    def close(self):
+        self._cur.close()
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cur.lastrowid
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    @property
+    def column_names(self):
+        return tuple(col[0] for col in self._cur.description or ())
+
+    def _row(self, row):
+        """Turns a row into a dictionary if the cursor was asked to."""
+        if row is None or not self.dictionary:
+            return row
+
+        return dict(zip(self.column_names, row))
+
+    def __iter__(self):
+        for row in self._cur:
+            yield self._row(row)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+@lru_cache(maxsize=1024)
+def _translate(stmt):
+    """Swaps the parameter markers of a statement for the ones of SQLite."""
+    return _PARAM_REGEX.sub(lambda m: '?' if m.group(1) == 's' else '%', stmt)
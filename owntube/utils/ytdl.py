@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Extraction of the info of videos through long-lived YoutubeDL instances and
+the info cache."""
+
+import json
+import os
+import tempfile
+import threading
+
+from owntube.utils import metrics
+from owntube.utils.cache import get_info_cache
+from owntube.utils.commonutils import read_config
+
+# YoutubeDL instances of the threads, which aren't safe to share.
+_local = threading.local()
+
+def extractor(logger):
+    """Gets the YoutubeDL instance of the current thread used to extract info,
+    creating it the first time or if the logger changed. Building one is
+    expensive, so long running workers keep on reusing theirs."""
+    if getattr(_local, 'logger', None) is not logger:
+        # yt-dlp takes a while to load its extractors, so it's only imported
+        # when it's actually needed.
+        from yt_dlp import YoutubeDL
+
+        _local.ydl = YoutubeDL({ 'logger': logger })
+        _local.logger = logger
+
+    return _local.ydl
+
+def extract_info(vid, url, logger, max_age = None):
+    """Gets the sanitized info of a video from the cache, or extracts it and
+    caches it if we don't have any that is younger than max_age seconds."""
+    cache = get_info_cache()
+    info = cache.get(vid, max_age)
+    if info is not None:
+        return info
+
+    ydl = extractor(logger)
+    with metrics.YTDLP_DURATION.time(operation='extract'):
+        info = ydl.sanitize_info(ydl.extract_info(url, download=False))
+    cache.set(vid, info)
+
+    return info
+
+def download_ttl():
+    """How long (in seconds) extracted info can be used to download a video
+    before the URLs of its formats expire."""
+    return read_config().get('info_cache', {}).get('download_ttl', 18000)
+
+def download_with_info(ydl, info):
+    """Downloads a video using info that was already extracted. yt-dlp
+    extracts it again from the URL if the info turns out to be stale. Returns
+    the return code of the download."""
+    fh = tempfile.NamedTemporaryFile('w', suffix='.info.json', delete=False)
+    try:
+        with fh:
+            json.dump(info, fh)
+        return ydl.download_with_info_file(fh.name)
+    finally:
+        os.remove(fh.name)
@@ -3,30 +3,37 @@
 import os
 from os.path import abspath, dirname
 from datetime import datetime
+from functools import lru_cache
 
-from yt_dlp import YoutubeDL
+from sty import fg
 
 import json
-import requests
-from requests.exceptions import HTTPError
-
-from sty import fg
 
-from owntube.utils.commonutils import download_image, read_config
+from owntube.utils import metrics, ytdl
 from owntube.utils.database import DatabaseItem
 from owntube.utils.loggers import ConsoleLogger
+from owntube.utils.pagination import default_count, encode_cursor
+from owntube.utils.queries import Template
 from owntube.utils.renderable import Renderable
+from owntube.timeline import Timeline
 from owntube.exceptions import VideoNotFound, VideoDownloadError
 import owntube.channel as channel
+import owntube.images as images
 
 class Video(DatabaseItem, Renderable):
     """Representation of an YouTube video."""
 
+    __slots__ = ('video_id', 'channel', 'title', 'description',
+                 'published_date', 'duration', 'width', 'height', 'fps',
+                 'chapters')
+
+    TABLE = 'videos'
+    COLUMNS = ('vid', 'channel_cid', 'title', 'description', 'published_date',
+               'duration', 'width', 'height', 'fps', 'chapters')
+
     def __init__(self, channel = None, video_id = None, title = None,
                  description = None, published_date = None, duration = None,
                  width = None, height = None, fps = None, chapters = None):
-        super().__init__('videos')
-
         self.video_id = video_id
         self.channel = channel
         self.title = title
@@ -58,6 +65,30 @@ class Video(DatabaseItem, Renderable):
 
         return d
 
+    @staticmethod
+    def dict_from_row(row, expand = None):
+        """Builds the same dictionary as __dict__ straight from a row, without
+        the cost of building the objects. Expanding requires the channel to be
+        joined in after the video columns."""
+        d = {
+            'id': row[0],
+            'title': row[2],
+            'description': row[3],
+            'published_date': row[4],
+            'duration': row[5],
+            'width': row[6],
+            'height': row[7],
+            'fps': row[8],
+            'chapters': None if (row[9] is None) else json.loads(row[9])
+        }
+
+        # Expand the channel?
+        if expand is not None:
+            d['channel'] = channel.Channel.dict_from_row(
+                row[len(Video.COLUMNS):])
+
+        return d
+
     def from_id(self, id, chan = None):
         # Fetch database row.
         row = self._fetch_by_id('vid', id)
@@ -67,7 +98,22 @@ class Video(DatabaseItem, Renderable):
         return self._from_row(row, chan)
 
     def save(self):
-        self._commit({
+        self._commit(self._params())
+
+    def delete(self):
+        """Deletes the video along with the records of its downloads."""
+        self._remove(self.video_id, (
+            ('downloaded_videos',
+             'SELECT id FROM downloaded_videos WHERE vid = %s'),))
+
+    @classmethod
+    def _saving(cls, cur, rows):
+        # Keep the home feed up to date.
+        Timeline().refresh(cur, [(row['vid'], row['published_date'])
+                                 for row in rows])
+
+    def _params(self):
+        return {
             'vid': self.video_id,
             'channel_cid': self.channel.channel_id,
             'title': self.title[0:254],
@@ -79,44 +125,80 @@ class Video(DatabaseItem, Renderable):
             'fps': self.fps,
             'chapters': None if (self.chapters is None) else
                 json.dumps(self.chapters)
-        })
+        }
 
     def exists(self):
         return self._check_exists('vid', self.video_id)
 
-    def list(self, count=None, since=None):
+    def from_ids(self, ids):
+        """Fetches a list of videos and their channels in a single query,
+        keeping the order of the IDs and skipping the ones that don't exist."""
+        if len(ids) == 0:
+            return []
+
+        stmt = f'SELECT {self._select_columns("videos")}, ' \
+               f'{channel.Channel._select_columns("channels")} FROM videos ' \
+               'INNER JOIN channels ON channels.cid = videos.channel_cid ' \
+               f'WHERE videos.vid IN ({", ".join(["%s"] * len(ids))})'
+
+        videos = {}
+        channels = {}
+        for row in self._iter_rows(stmt, list(ids)):
+            videos[row[0]] = Video()._from_row(
+                row[:len(Video.COLUMNS)],
+                channels=self._channel_map(channels, row))
+
+        return [videos[id] for id in ids if id in videos]
+
+    def list(self, count=None, since=None, after=None):
         """Gets the lastest videos or all the videos since a date."""
-        videos = []
-
-        # Ensure the user gets something.
-        if count is None and since is None:
-            count = read_config()['settings']['video_count']
-
-        # Build up statement depending on our constraints.
-        stmt = 'SELECT * FROM videos '
-        if since is not None:
-            stmt += 'WHERE published_date >= %s '
-        stmt += 'ORDER BY published_date DESC '
-        if count is not None:
-            stmt += 'LIMIT %s '
-
-        with self.conn.cursor() as cur:
-            # Setup our statement parameters.
-            params = []
-            if since is not None:
-                params.append(since.strftime('%Y-%m-%d %H:%M:%S'))
-            if count is not None:
-                params.append(count)
-
-            # Get our videos.
-            cur.execute(stmt, params)
-            for row in cur.fetchall():
-                videos.append(Video()._from_row(row))
-
-        return videos
-
-    def download(self, height, logger = ConsoleLogger()):
-        """Downloads a video in a specific resolution."""
+        return list(self.iter(default_count(count, since), since, after))
+
+    def iter(self, count=None, since=None, after=None, chan=None):
+        """Iterates over the latest videos (of a channel) straight from the
+        database cursor. The after argument is the sort key of the last video
+        of the previous page."""
+        # Get our videos, building each channel only once.
+        channels = {} if chan is None else { chan.channel_id: chan }
+        for row in self._query(self._listing(count, since, after, chan)):
+            yield Video()._from_row(row[:len(Video.COLUMNS)],
+                                    channels=self._channel_map(channels, row))
+
+    def iter_dicts(self, count=None, since=None, after=None, chan=None):
+        """Iterates over the latest videos (of a channel) as dictionaries for
+        read-only listings. The channel is only expanded when listing the
+        videos of every channel."""
+        expand = True if chan is None else None
+        for row in self._query(self._listing(count, since, after, chan)):
+            yield self.dict_from_row(row, expand)
+
+    @property
+    def cursor(self):
+        """Page token that continues a listing right after this video."""
+        return encode_cursor(self.published_date.strftime('%Y-%m-%d %H:%M:%S'),
+                             self.video_id)
+
+    @staticmethod
+    def dict_cursor(d):
+        """Page token that continues a listing right after a video
+        dictionary."""
+        return encode_cursor(d['published_date'].strftime('%Y-%m-%d %H:%M:%S'),
+                             d['id'])
+
+    def _listing(self, count, since, after, chan):
+        """Builds the query of a listing of videos."""
+        return _listing_template().bind({
+            'chan': None if chan is None else [chan.channel_id],
+            'since': None if since is None else
+                [since.strftime('%Y-%m-%d %H:%M:%S')],
+            'after': None if after is None else [after[0], after[0], after[1]]
+        }, count)
+
+    def download(self, height, logger = ConsoleLogger(), ratelimit = None,
+                 progress = None):
+        """Downloads a video in a specific resolution, optionally capping its
+        bandwidth (in bytes per second) and reporting the progress of the
+        download and its post-processing to a YoutubeDL progress hook."""
         # Setup the options for the download.
         opts = {
             'outtmpl': {
@@ -132,22 +214,29 @@ class Video(DatabaseItem, Renderable):
             'logger': logger,
             'progress_hooks': [self._download_hook]
         }
-
-        # Perform the download.
-        with YoutubeDL(opts) as ydl:
-            ydl.download(self.url)
+        if ratelimit is not None:
+            opts['ratelimit'] = ratelimit
+        if progress is not None:
+            opts['progress_hooks'].append(progress)
+            opts['postprocessor_hooks'] = [progress]
+
+        # Reuse the info we extracted unless the URLs in it may have expired.
+        info = ytdl.extract_info(self.video_id, self.url, logger,
+                                 ytdl.download_ttl())
+
+        # Perform the download. yt-dlp takes a while to load its extractors, so
+        # it's only imported when it's actually needed.
+        from yt_dlp import YoutubeDL
+        with YoutubeDL(opts) as ydl, \
+                metrics.YTDLP_DURATION.time(operation='download'):
+            if ytdl.download_with_info(ydl, info) != 0:
+                raise VideoDownloadError()
 
     @property
     def url(self):
         """Original YouTube URL to this video."""
         return f'https://www.youtube.com/watch?v={self.video_id}'
 
-    @property
-    @staticmethod
-    def thumbs_dir(self):
-        """Location of the thumbnails directory."""
-        return dirname(abspath(__file__)) + '/static/thumbnails'
-
     @property
     @staticmethod
     def video_dir(self):
@@ -155,12 +244,18 @@ class Video(DatabaseItem, Renderable):
         return dirname(abspath(__file__)) + '/static/videos'
 
     @staticmethod
-    def import_from_dump(channel, video):
-        """Imports data from a JSON object inside of a dump made with ytdump."""
-        self = Video(channel, video['resourceId']['videoId'],
+    def from_dump(channel, video):
+        """Builds a video from a JSON object inside of a dump made with ytdump
+        without saving it."""
+        return Video(channel, video['resourceId']['videoId'],
                      video['title'], video['description'],
                      datetime.fromisoformat(video['publishedAt']), None)
 
+    @staticmethod
+    def import_from_dump(channel, video):
+        """Imports data from a JSON object inside of a dump made with ytdump."""
+        self = Video.from_dump(channel, video)
+
         # Save the video to the database.
         self.save()
 
@@ -170,38 +265,28 @@ class Video(DatabaseItem, Renderable):
         return self
 
     def _fetch_thumbnail(self, thumbs):
-        """Downloads the video's thumbnail from the thumbnails list."""
-        url = None
-
-        # Get the highest resolution thumbnail possible.
-        resolution = 0
-        for name, thumbnail in thumbs.items():
-            tbres = thumbnail['width'] * thumbnail['height']
-            if tbres > resolution:
-                resolution = tbres
-                url = thumbnail["url"]
-
-        # Actually download the thumbnail.
-        try:
-            download_image(url, f'{self.thumbs_dir}/{self.video_id}.jpg')
-        except HTTPError as err:
-            print(f'{fg.red}Error: Failed to fetch video thumbnail from {url}\n'
-                  f'{err}{fg.rs}')
+        """Downloads the video's thumbnail from the thumbnails list and returns
+        its size."""
+        return images.ImagePipeline.shared().fetch(
+            'thumbnails', self.video_id, images.best_thumbnail(thumbs))
 
     def _fetch_metadata(self):
         """Fetches extra metadata and saves it to the database."""
-        with YoutubeDL({}) as ydl:
-            info = ydl.sanitize_info(ydl.extract_info(self.url, download=False))
+        self._extract_metadata()
+        self.save()
+
+    def _extract_metadata(self, logger = ConsoleLogger()):
+        """Populates ourselves with extra metadata without saving it."""
+        info = ytdl.extract_info(self.video_id, self.url, logger)
 
-            # Populate ourselves with the extra metadata.
-            self.duration = info['duration']
-            self.width = info['width']
-            self.height = info['height']
-            self.fps = info['fps']
-            self.chapters = info['chapters']
+        # Populate ourselves with the extra metadata.
+        self.duration = info['duration']
+        self.width = info['width']
+        self.height = info['height']
+        self.fps = info['fps']
+        self.chapters = info['chapters']
 
-            # Commit the changes.
-            self.save()
+        return self
 
     def _download_hook(self, data):
         """Responds to events fired by a YoutubeDL download."""
@@ -210,18 +295,37 @@ class Video(DatabaseItem, Renderable):
 
             print(f'{fg.green}Downloaded {data["filename"]}{fg.rs}')
             if info['ext'] == 'mp4':
-                # Save information about the downloaded video to the database.
+                # Save information about the downloaded video to the database
+                # unless we already have it.
                 download = DownloadedVideo(
                     None, self, info['width'], info['height'], info['fps'],
-                    data['total_bytes'], info['ext'])
-                download.save()
+                    data.get('total_bytes'), info['ext'])
+                if not any(d.height == download.height and
+                           d.extension == download.extension
+                           for d in DownloadedVideo().list(self)):
+                    download.save()
         elif data['status'] == 'error':
             raise VideoDownloadError(data = data)
 
-    def _from_row(self, row, chan = None):
-        # Get the channel if needed.
+    @staticmethod
+    def _channel_map(channels, row):
+        """Adds the channel joined into a video row to an identity map."""
+        cid = row[1]
+        if cid not in channels:
+            channels[cid] = channel.Channel()._from_row(
+                row[len(Video.COLUMNS):])
+
+        return channels
+
+    def _from_row(self, row, chan = None, channels = None):
+        # Get the channel if needed, going through the identity map first.
+        if chan is None and channels is not None:
+            chan = channels.get(row[1])
         if chan is None:
-            self.channel = channel.Channel().from_id(row[1])
+            chan = channel.Channel().from_id(row[1])
+            if channels is not None:
+                channels[row[1]] = chan
+        self.channel = chan
 
         # Populate ourselves.
         self.video_id = row[0]
@@ -234,19 +338,44 @@ class Video(DatabaseItem, Renderable):
         self.fps = row[8]
         self.chapters = None if (row[9] is None) else json.loads(row[9])
 
-        # Fetch additional metadata if needed.
-        if self.height is None:
-            self._fetch_metadata()
-
         return self
 
-class DownloadedVideo(DatabaseItem):
+@lru_cache(maxsize=None)
+def _listing_template():
+    """Template of the listings of videos. The channels are joined in so that
+    we don't have to fetch them one by one."""
+    return Template(
+        'VideoRow',
+        f'SELECT {Video._select_columns("videos")}, '
+        f'{channel.Channel._select_columns("channels")} FROM videos '
+        'INNER JOIN channels ON channels.cid = videos.channel_cid {where}'
+        'ORDER BY videos.published_date DESC, videos.vid DESC {limit}',
+        Video.COLUMNS + tuple(f'channels_{col}'
+                              for col in channel.Channel.COLUMNS),
+        {
+            'chan': 'videos.channel_cid = %s',
+            'since': 'videos.published_date >= %s',
+            'after': '(videos.published_date < %s OR '
+                     '(videos.published_date = %s AND videos.vid < %s))'
+        })
+
+class DownloadedVideo(DatabaseItem, Renderable):
     """Representation of a local video."""
 
+    __slots__ = ('id', 'video', 'width', 'height', 'fps', 'filesize',
+                 'extension')
+
+    TABLE = 'downloaded_videos'
+    COLUMNS = ('id', 'vid', 'width', 'height', 'fps', 'filesize', 'extension')
+
+    # Downloaded copies of a video.
+    _LIST = Template('DownloadedVideoRow',
+                     f'SELECT {", ".join(COLUMNS)} FROM downloaded_videos '
+                     '{where}ORDER BY height', COLUMNS,
+                     { 'vid': 'vid = %s' })
+
     def __init__(self, id = None, video = None, width = None, height = None,
                  fps = None, filesize = None, extension = None):
-        super().__init__('downloaded_videos')
-
         self.id = id
         self.video = video
         self.width = width
@@ -255,6 +384,35 @@ class DownloadedVideo(DatabaseItem):
         self.filesize = filesize
         self.extension = extension
 
+    def __dict__(self, expand=None):
+        d = {
+            'id': self.id,
+            'width': self.width,
+            'height': self.height,
+            'fps': self.fps,
+            'filesize': self.filesize,
+            'extension': self.extension
+        }
+
+        # Expand the video?
+        if expand is not None:
+            d['video'] = self.video.__dict__()
+
+        return d
+
+    @staticmethod
+    def dict_from_row(row):
+        """Builds the same dictionary as __dict__ straight from a row, without
+        the cost of building the objects."""
+        return {
+            'id': row[0],
+            'width': row[2],
+            'height': row[3],
+            'fps': row[4],
+            'filesize': row[5],
+            'extension': row[6]
+        }
+
     def from_id(self, id, video = None):
         # Fetch database row.
         row = self._fetch_by_id('id', id)
@@ -264,7 +422,14 @@ class DownloadedVideo(DatabaseItem):
         return self._from_row(row, video)
 
     def save(self):
-        self._commit({
+        self._commit(self._params())
+
+    def delete(self):
+        """Deletes the record of the downloaded copy."""
+        self._remove(self.id)
+
+    def _params(self):
+        return {
             'id': self.id,
             'vid': self.video.video_id,
             'width': self.width,
@@ -272,20 +437,27 @@ class DownloadedVideo(DatabaseItem):
             'fps': self.fps,
             'filesize': self.filesize,
             'extension': self.extension
-        })
+        }
 
     def exists(self):
         return self._check_exists('id', self.id)
 
+    def list(self, video):
+        """Gets the downloaded copies of a video."""
+        return [DownloadedVideo()._from_row(row, video) for row in
+                self._query(self._LIST.bind({ 'vid': [video.video_id] }))]
+
     @property
     def path(self):
         """Path to where the video is located at."""
-        return f'{Video.video_dir}/{self.video.video_id}_{self.height}.mp4'
+        return f'{self.video.video_dir}/{self.video.video_id}_{self.height}.' \
+               f'{self.extension}'
 
     def _from_row(self, row, video = None):
         # Get the video if needed.
         if video is None:
-            self.video = Video().from_id(row[1])
+            video = Video().from_id(row[1])
+        self.video = video
 
         # Populate ourselves.
         self.id = row[0]
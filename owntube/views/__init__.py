@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Helpers shared by the views."""
+
+import hashlib
+from functools import wraps
+
+from flask import Response, json, make_response, request, stream_with_context
+
+from owntube.utils.cache import get_cache
+
+def stream_listing(key, items, fmt):
+    """Streams a listing item by item as JSON lines or as a JSON document
+    whose key holds the list of items."""
+    def generate_jsonl():
+        for item in items:
+            yield json.dumps(item) + '\n'
+
+    def generate_json():
+        yield f'{{"{key}": ['
+        first = True
+        for item in items:
+            yield ('' if first else ', ') + json.dumps(item)
+            first = False
+        yield ']}'
+
+    if fmt == 'jsonl':
+        return Response(stream_with_context(generate_jsonl()),
+                        mimetype='application/x-ndjson')
+
+    return Response(stream_with_context(generate_json()),
+                    mimetype='application/json')
+
+def cached(*depends):
+    """Caches the responses of a view until the tables or rows it depends on
+    change. Dependencies may reference the view arguments, for example
+    'videos:{id}'. ETags are derived from the same information, so clients
+    that already have the current version get a 304 without any work."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            cache = get_cache()
+
+            # Build up the key and version of the response.
+            names = [name.format(**kwargs) for name in depends]
+            key = f'{request.endpoint}:{sorted(kwargs.items())}:' \
+                  f'{sorted(request.args.items(multi=True))}:' \
+                  f'{request.accept_mimetypes.accept_html}'
+            version = f'{key}:{cache.generation(names)}'
+            etag = hashlib.sha1(version.encode('utf-8')).hexdigest()
+
+            # Check if the client already has it.
+            if etag in request.if_none_match:
+                resp = Response(status=304)
+                resp.set_etag(etag)
+                return resp
+
+            # Serve it from the cache or generate it.
+            entry = cache.get(version)
+            if entry is not None:
+                resp = Response(entry[2], status=entry[0], mimetype=entry[1])
+            else:
+                resp = make_response(view(**kwargs))
+                if resp.status_code != 200 or resp.is_streamed:
+                    return resp
+                cache.set(version, (resp.status_code, resp.mimetype,
+                                    resp.get_data()))
+
+            resp.set_etag(etag)
+            resp.cache_control.no_cache = True
+            return resp
+
+        return wrapper
+
+    return decorator
@@ -5,44 +5,68 @@ from datetime import datetime
 from flask import Blueprint, request
 
 from owntube.channel import Channel
-from owntube.exceptions import ChannelNotFound, OwnTubeBaseException
+from owntube.video import Video
+from owntube.utils.pagination import decode_cursor, default_count, next_cursor
+from owntube.views import cached, stream_listing
+from owntube.exceptions import ChannelNotFound, InvalidCursor, \
+    OwnTubeBaseException
 
 # Create the view blueprint.
 bp = Blueprint('channel', __name__, url_prefix='/channel')
 
 @bp.route('/')
+@cached('channels')
 def list_channels():
     """Lists all of the channels."""
-    # Generate channel list.
-    resp = { 'channels': [] }
-    for channel in Channel().list():
-        resp['channels'].append(channel.__dict__(expand=None))
+    # Get URL parameters.
+    count = request.args.get('count', type=int)
+    after = decode_cursor(request.args.get('after', type=str), 1)
 
-    return resp
+    # Stream the listing straight from the database if requested.
+    stream = request.args.get('stream', type=str)
+    if stream is not None:
+        return stream_listing('channels', Channel().iter_dicts(
+            count=count, after=after), stream)
+
+    # Generate channel list.
+    channels = list(Channel().iter_dicts(count=count, after=after))
+    return { 'channels': channels,
+             'next': next_cursor(channels, count, Channel.dict_cursor) }
 
 @bp.route('/<id>')
+@cached('channels:{id}')
 def show(id):
     """Gets detailed information about the channel."""
     channel = Channel().from_id(id)
     return channel.__dict__(expand=True)
 
 @bp.route('/<id>/videos')
+@cached('channels:{id}', 'videos')
 def list_videos(id):
     """Lists the videos from the channel."""
     # Get the channel.
     channel = Channel().from_id(id)
-    resp = channel.__dict__(expand=True)
 
     # Get URL parameters.
     count = request.args.get('count', type=int)
     since = request.args.get('since', type=str)
     if since is not None:
         since = datetime.fromisoformat(since)
+    after = decode_cursor(request.args.get('after', type=str), 2)
+
+    # Stream the whole listing straight from the database if requested.
+    stream = request.args.get('stream', type=str)
+    if stream is not None:
+        return stream_listing('videos', channel.iter_video_dicts(
+            count=count, since=since, after=after), stream)
 
     # Append video list.
-    resp['videos'] = []
-    for video in channel.videos(count=count, since=since):
-        resp['videos'].append(video.__dict__(expand=None))
+    count = default_count(count, since)
+    videos = list(channel.iter_video_dicts(count=count, since=since,
+                                           after=after))
+    resp = channel.__dict__(expand=True)
+    resp['videos'] = videos
+    resp['next'] = next_cursor(videos, count, Video.dict_cursor)
 
     return resp
 
@@ -50,6 +74,10 @@ def list_videos(id):
 def handle_channel_not_found(err):
     return { 'error': err.__dict__() }, 404
 
+@bp.errorhandler(InvalidCursor)
+def handle_invalid_cursor(err):
+    return { 'error': err.__dict__() }, 400
+
 @bp.errorhandler(OwnTubeBaseException)
 def handle_base_exception(err):
     return { 'error': err.__dict__() }, 500
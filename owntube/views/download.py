@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""View abstraction for the video download queue."""
+
+from flask import Blueprint, request
+
+from owntube.downloads import DownloadQueue
+from owntube.video import Video
+from owntube.exceptions import DownloadJobNotFound, InvalidHeight, \
+    VideoNotFound, OwnTubeBaseException
+
+# Create the view blueprint.
+bp = Blueprint('download', __name__, url_prefix='/download')
+
+@bp.route('/', methods=['POST'])
+def enqueue():
+    """Queues up the download of a video."""
+    # Get the parameters from the form, JSON body or URL.
+    params = request.get_json(silent=True) or request.values
+    video = Video().from_id(params.get('vid'))
+    height = params.get('height', 1080)
+    try:
+        height = int(height)
+    except (TypeError, ValueError):
+        raise InvalidHeight()
+    if not DownloadQueue.MIN_HEIGHT <= height <= DownloadQueue.MAX_HEIGHT:
+        raise InvalidHeight()
+
+    return { 'job': DownloadQueue().enqueue(video.video_id, height) }, 202
+
+@bp.route('/')
+def list_jobs():
+    """Lists the latest download jobs."""
+    state = request.args.get('state', type=str)
+    count = request.args.get('count', default=100, type=int)
+
+    return { 'jobs': DownloadQueue().list(state, count) }
+
+@bp.route('/<int:id>')
+def show(id):
+    """Gets the state and progress of a download job."""
+    return { 'job': DownloadQueue().get(id) }
+
+@bp.errorhandler(DownloadJobNotFound)
+@bp.errorhandler(VideoNotFound)
+def handle_not_found(err):
+    return { 'error': err.__dict__() }, 404
+
+@bp.errorhandler(InvalidHeight)
+def handle_bad_request(err):
+    return { 'error': err.__dict__() }, 400
+
+@bp.errorhandler(OwnTubeBaseException)
+def handle_base_exception(err):
+    return { 'error': err.__dict__() }, 500
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""View abstraction for the stored thumbnails and avatars."""
+
+import os
+
+from flask import Blueprint, redirect, send_from_directory, url_for
+
+from owntube.images import ImagePipeline
+from owntube.exceptions import ImageNotFound, OwnTubeBaseException
+
+# Create the view blueprint.
+bp = Blueprint('image', __name__, url_prefix='/image')
+
+# How long browsers may keep content-addressed images around.
+STORE_MAX_AGE = 31536000
+
+@bp.route('/<any(thumbnails, avatars):kind>/<id>')
+@bp.route('/<any(thumbnails, avatars):kind>/<id>/<variant>')
+def show(kind, id, variant = None):
+    """Redirects to the stored image of a video or channel, resized for where
+    it's going to be shown if a variant is requested."""
+    stored = ImagePipeline.lookup(kind, id)
+    if stored is None:
+        raise ImageNotFound()
+    digest, extension = stored
+
+    # Fall back to the original if the variant wasn't generated.
+    name = f'{digest[:2]}/{digest}.{extension}'
+    if variant is not None and \
+            os.path.exists(ImagePipeline.path(digest, 'webp', variant)):
+        name = f'{digest[:2]}/{digest}_{variant}.webp'
+
+    resp = redirect(url_for('image.stored', name=name))
+    resp.cache_control.public = True
+    resp.cache_control.max_age = 3600
+    return resp
+
+@bp.route('/store/<path:name>')
+def stored(name):
+    """Serves a content-addressed image, which never changes."""
+    resp = send_from_directory(ImagePipeline.STORE_DIR, name,
+                               max_age=STORE_MAX_AGE)
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
+
+@bp.errorhandler(ImageNotFound)
+def handle_image_not_found(err):
+    return { 'error': err.__dict__() }, 404
+
+@bp.errorhandler(OwnTubeBaseException)
+def handle_base_exception(err):
+    return { 'error': err.__dict__() }, 500
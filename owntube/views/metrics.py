@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Instrumentation of the requests and the Prometheus metrics endpoint."""
+
+import time
+
+from flask import Blueprint, Response, g, request
+from sty import fg
+
+from owntube.utils import metrics
+from owntube.utils.cache import get_cache
+from owntube.utils.commonutils import db_pool, read_config
+
+# Create the view blueprint.
+bp = Blueprint('metrics', __name__)
+
+@bp.before_app_request
+def start_request():
+    """Starts keeping track of the time and queries of a request."""
+    g.request_start = time.perf_counter()
+    g.db_queries = 0
+    g.db_time = 0.0
+    g.db_log = []
+
+@bp.after_app_request
+def finish_request(resp):
+    """Accounts for a request once its response is ready. Streamed responses
+    are only timed until they start being sent."""
+    if 'request_start' not in g:
+        return resp
+
+    elapsed = time.perf_counter() - g.request_start
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.REQUEST_DURATION.observe(elapsed, endpoint=endpoint,
+                                     method=request.method,
+                                     status=resp.status_code)
+    metrics.REQUEST_QUERIES.observe(g.db_queries, endpoint=endpoint)
+    metrics.REQUEST_QUERY_TIME.observe(g.db_time, endpoint=endpoint)
+
+    # Log slow requests along with the queries behind them.
+    threshold = read_config()['settings'].get('slow_request_ms')
+    if threshold is not None and elapsed * 1000 >= threshold:
+        log_slow_request(elapsed)
+
+    return resp
+
+def log_slow_request(elapsed):
+    """Prints out a request that took too long and the queries it made."""
+    lines = [f'{fg.yellow}Slow request: {request.method} {request.full_path} '
+             f'took {elapsed * 1000:.1f} ms with {g.db_queries} queries '
+             f'({g.db_time * 1000:.1f} ms){fg.rs}']
+    for stmt, took in g.db_log:
+        lines.append(f'  {took * 1000:8.2f} ms  {" ".join(stmt.split())}')
+    if g.db_queries > len(g.db_log):
+        lines.append(f'  ... {g.db_queries - len(g.db_log)} more')
+
+    print('\n'.join(lines))
+
+@bp.route('/metrics')
+def show():
+    """Exposes the metrics of this process in the Prometheus text format."""
+    lines = metrics.render_all()
+
+    # Usage of the cache.
+    cache = get_cache().stats()
+    lookups = cache['hits'] + cache['misses']
+    lines += gauge('owntube_cache_hits_total', 'counter',
+                   'Lookups found in the response cache.', cache['hits'])
+    lines += gauge('owntube_cache_misses_total', 'counter',
+                   'Lookups missing from the response cache.',
+                   cache['misses'])
+    lines += gauge('owntube_cache_hit_ratio', 'gauge',
+                   'Share of the lookups found in the response cache.',
+                   cache['hits'] / lookups if lookups > 0 else 0)
+
+    # Usage of the connection pool.
+    for name, value in db_pool().stats().items():
+        lines += gauge(f'owntube_db_pool_{name}', 'gauge',
+                       f'Database connection pool {name.replace("_", " ")}.',
+                       value)
+
+    return Response('\n'.join(lines) + '\n',
+                    mimetype='text/plain; version=0.0.4')
+
+def gauge(name, type, help, value):
+    """Renders a single value in the Prometheus text format."""
+    return [f'# HELP {name} {help}', f'# TYPE {name} {type}',
+            f'{name} {value}']
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""View abstraction for the status of the background services."""
+
+from flask import Blueprint
+
+from owntube.enrichment import MetadataQueue
+from owntube.utils.cache import get_cache, get_info_cache
+from owntube.utils.commonutils import db_pool
+from owntube.exceptions import OwnTubeBaseException
+
+# Create the view blueprint.
+bp = Blueprint('status', __name__, url_prefix='/status')
+
+@bp.route('/')
+def show():
+    """Gets the state of the connection pool, cache and background
+    backlogs."""
+    return {
+        'database': db_pool().stats(),
+        'cache': get_cache().stats(),
+        'info_cache': get_info_cache().stats(),
+        'enrichment': MetadataQueue().status()
+    }
+
+@bp.errorhandler(OwnTubeBaseException)
+def handle_base_exception(err):
+    return { 'error': err.__dict__() }, 500
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""View abstraction for the incremental sync of mirrors."""
+
+from flask import Blueprint, request
+
+from owntube.sync import ChangeFeed
+from owntube.utils.pagination import decode_cursor, encode_cursor
+from owntube.exceptions import InvalidCursor, OwnTubeBaseException
+
+# Create the view blueprint.
+bp = Blueprint('sync', __name__, url_prefix='/sync')
+
+@bp.route('/')
+def changes():
+    """Gets a batch of the channels, videos and downloads that changed since
+    the cursor of the previous batch, or everything when there's none."""
+    # Get URL parameters.
+    count = request.args.get('count', type=int)
+    cursor = decode_cursor(request.args.get('cursor', type=str), 1)
+    after = 0
+    if cursor is not None:
+        if not cursor[0].isdigit():
+            raise InvalidCursor()
+        after = int(cursor[0])
+
+    # Keep the cursor opaque, just like the listings.
+    resp = ChangeFeed().batch(after, count)
+    resp['cursor'] = encode_cursor(str(resp.pop('seq')))
+    return resp
+
+@bp.errorhandler(InvalidCursor)
+def handle_bad_request(err):
+    return { 'error': err.__dict__() }, 400
+
+@bp.errorhandler(OwnTubeBaseException)
+def handle_base_exception(err):
+    return { 'error': err.__dict__() }, 500
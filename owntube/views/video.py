@@ -1,17 +1,28 @@
 #!/usr/bin/env python3
 """View abstraction for videos on the platform."""
 
+import os
 from datetime import datetime
-from flask import Blueprint, request, render_template
+from flask import Blueprint, Response, request, render_template, send_file
 
-from owntube.video import Video
-from owntube.exceptions import VideoNotFound, OwnTubeBaseException
+from owntube.utils.commonutils import read_config
+
+from owntube.channel import Channel
+from owntube.search import VideoSearch
+from owntube.timeline import Timeline
+from owntube.video import DownloadedVideo, Video
+from owntube.utils.pagination import decode_cursor, default_count, \
+    encode_cursor, next_cursor
+from owntube.views import cached, stream_listing
+from owntube.exceptions import InvalidCursor, InvalidSearch, VideoNotFound, \
+    OwnTubeBaseException
 
 # Create the view blueprint.
 bp = Blueprint('video', __name__, url_prefix='/video')
 
 
 @bp.route('/')
+@cached('videos', 'channels')
 def list_videos():
     """Lists the videos from all channels."""
     # Get URL parameters.
@@ -19,11 +30,21 @@ def list_videos():
     since = request.args.get('since', type=str)
     if since is not None:
         since = datetime.fromisoformat(since)
+    after = decode_cursor(request.args.get('after', type=str), 2)
 
-    # Append video list.
-    resp = {'videos': []}
-    for video in Video().list(count=count, since=since):
-        resp['videos'].append(video.__dict__(expand=['channel']))
+    # Stream the whole listing straight from the database if requested.
+    stream = request.args.get('stream', type=str)
+    if stream is not None:
+        return stream_listing('videos', Timeline().iter_dicts(
+            count=count, since=since, after=after), stream)
+
+    # Append video list, which comes from the timeline unless we're deep into
+    # the archive.
+    count = default_count(count, since)
+    videos = list(Timeline().iter_dicts(count=count, since=since,
+                                        after=after))
+    resp = {'videos': videos,
+            'next': next_cursor(videos, count, Video.dict_cursor)}
 
     if request.accept_mimetypes.accept_html:
         return render_template('channel_videos.html', resp=resp)
@@ -31,18 +52,90 @@ def list_videos():
         return resp
 
 
+@bp.route('/search')
+@cached('videos', 'channels')
+def search():
+    """Searches for videos ranked by relevance."""
+    # Get URL parameters.
+    query = request.args.get('q', type=str)
+    if query is None or query.strip() == '':
+        raise InvalidSearch()
+    mode = request.args.get('mode', default='natural', type=str)
+    count = default_count(request.args.get('count', type=int))
+    after = decode_cursor(request.args.get('after', type=str), 2)
+    chan = request.args.get('channel', type=str)
+    if chan is not None:
+        chan = Channel().from_id(chan)
+
+    # Search and build the page.
+    results = VideoSearch().search(query, mode, chan, count, after)
+    resp = {'videos': [], 'next': None}
+    for video, score in results:
+        resp['videos'].append(video.__dict__(expand=['channel']))
+        resp['videos'][-1]['score'] = score
+    if len(results) == count:
+        video, score = results[-1]
+        resp['next'] = encode_cursor(repr(score), video.video_id)
+
+    return resp
+
+
 @bp.route('/<id>')
+@cached('videos:{id}', 'channels', 'downloaded_videos')
 def show(id):
     """Gets detailed information about a single video."""
     video = Video().from_id(id)
+    resp = video.__dict__(expand=True)
 
-    # TODO: Get downloaded videos list.
+    # Get downloaded videos list.
+    resp['downloads'] = []
+    for download in DownloadedVideo().list(video):
+        resp['downloads'].append(download.__dict__())
 
     if request.accept_mimetypes.accept_html:
-        return render_template('video_detail.html',
-                               video=video.__dict__(expand=True))
+        return render_template('video_detail.html', video=resp)
     else:
-        return video.__dict__(expand=True)
+        return resp
+
+
+@bp.route('/<id>/stream/<int:height>')
+def stream(id, height):
+    """Streams a downloaded copy of a video with support for seeking."""
+    video = Video().from_id(id)
+    for download in DownloadedVideo().list(video):
+        if download.height == height and os.path.exists(download.path):
+            return send_video(download.path)
+
+    raise VideoNotFound("Downloaded video wasn't found")
+
+
+def send_video(path):
+    """Sends a video file, letting the web server do the heavy lifting if it
+    has been configured to do so."""
+    settings = read_config()['settings']
+    mode = settings.get('sendfile')
+
+    # Let nginx serve the file from an internal location.
+    if mode == 'nginx':
+        resp = Response(mimetype='video/mp4')
+        resp.headers['X-Accel-Redirect'] = \
+            f'{settings.get("sendfile_prefix", "/protected/videos")}/' \
+            f'{os.path.basename(path)}'
+        return resp
+
+    # Let Apache or lighttpd serve the file from its absolute path.
+    if mode == 'x-sendfile':
+        resp = Response(mimetype='video/mp4')
+        resp.headers['X-Sendfile'] = os.path.abspath(path)
+        return resp
+
+    # Serve it ourselves with range requests handled by Werkzeug, which seeks
+    # straight to the requested range and hands the file to the server's
+    # wsgi.file_wrapper (sendfile) when there is one.
+    stat = os.stat(path)
+    return send_file(path, mimetype='video/mp4', conditional=True,
+                     etag=f'{stat.st_size:x}-{stat.st_mtime_ns:x}',
+                     last_modified=stat.st_mtime)
 
 
 @bp.errorhandler(VideoNotFound)
@@ -50,6 +143,12 @@ def handle_video_not_found(err):
     return {'error': err.__dict__()}, 404
 
 
+@bp.errorhandler(InvalidCursor)
+@bp.errorhandler(InvalidSearch)
+def handle_bad_request(err):
+    return {'error': err.__dict__()}, 400
+
+
 @bp.errorhandler(OwnTubeBaseException)
 def handle_base_exception(err):
     return {'error': err.__dict__()}, 500
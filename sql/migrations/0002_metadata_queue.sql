@@ -0,0 +1,15 @@
+-- 0002_metadata_queue.sql
+-- Queue of the videos whose extra metadata still has to be fetched by the
+-- enrichment worker.
+
+CREATE TABLE IF NOT EXISTS metadata_queue(
+	vid			VARCHAR(11)		CHARACTER SET 'ascii' COLLATE 'ascii_bin' NOT NULL PRIMARY KEY,
+	queued_at	DATETIME		NOT NULL DEFAULT CURRENT_TIMESTAMP,
+	attempts	TINYINT			NOT NULL DEFAULT 0,
+	last_error	TEXT			NULL,
+
+	INDEX (attempts, queued_at),
+
+	FOREIGN KEY (vid) REFERENCES videos (vid)
+		ON DELETE CASCADE ON UPDATE CASCADE
+);
@@ -0,0 +1,16 @@
+-- 0003_feed_state.sql
+-- Conditional request headers and schedule of the polls of the channels' RSS
+-- feeds.
+
+CREATE TABLE IF NOT EXISTS feed_state(
+	cid				VARCHAR(30)		CHARACTER SET 'ascii' COLLATE 'ascii_bin' NOT NULL PRIMARY KEY,
+	etag			VARCHAR(255)	NULL,
+	last_modified	VARCHAR(64)		NULL,
+	poll_interval	INT				NOT NULL,
+	next_poll		DATETIME		NOT NULL,
+
+	INDEX (next_poll),
+
+	FOREIGN KEY (cid) REFERENCES channels (cid)
+		ON DELETE CASCADE ON UPDATE CASCADE
+);
@@ -0,0 +1,24 @@
+-- 0005_download_jobs.sql
+-- Persistent queue of the downloads that the download workers process.
+
+CREATE TABLE IF NOT EXISTS download_jobs(
+	id					BIGINT			NOT NULL AUTO_INCREMENT PRIMARY KEY,
+	vid					VARCHAR(11)		CHARACTER SET 'ascii' COLLATE 'ascii_bin' NOT NULL,
+	height				SMALLINT		NOT NULL,
+	state				ENUM('queued', 'running', 'done', 'failed')	NOT NULL DEFAULT 'queued',
+	attempts			TINYINT			NOT NULL DEFAULT 0,
+	next_attempt		DATETIME		NOT NULL DEFAULT CURRENT_TIMESTAMP,
+	downloaded_bytes	BIGINT			NULL,
+	total_bytes			BIGINT			NULL,
+	speed				INT				NULL,
+	error				TEXT			NULL,
+	created_at			DATETIME		NOT NULL DEFAULT CURRENT_TIMESTAMP,
+	updated_at			DATETIME		NOT NULL DEFAULT CURRENT_TIMESTAMP
+		ON UPDATE CURRENT_TIMESTAMP,
+
+	UNIQUE (vid, height),
+	INDEX (state, next_attempt),
+
+	FOREIGN KEY (vid) REFERENCES videos (vid)
+		ON DELETE CASCADE ON UPDATE CASCADE
+);
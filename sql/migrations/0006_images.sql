@@ -0,0 +1,14 @@
+-- 0006_images.sql
+-- Where the content-addressed thumbnails and avatars came from and where
+-- they are stored.
+
+CREATE TABLE IF NOT EXISTS images(
+	kind		ENUM('thumbnails', 'avatars')	NOT NULL,
+	owner		VARCHAR(30)		CHARACTER SET 'ascii' COLLATE 'ascii_bin' NOT NULL,
+	url			VARCHAR(512)	NOT NULL,
+	etag		VARCHAR(255)	NULL,
+	hash		CHAR(40)		CHARACTER SET 'ascii' NOT NULL,
+	extension	VARCHAR(4)		NOT NULL,
+
+	PRIMARY KEY (kind, owner)
+);
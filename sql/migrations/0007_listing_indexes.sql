@@ -0,0 +1,18 @@
+-- 0007_listing_indexes.sql
+-- Indexes that match the way the listings are queried, so that pages are read
+-- straight from the index instead of sorting every row of a channel.
+
+-- Latest videos of a channel and of every channel, keyset paginated by
+-- (published_date, vid).
+ALTER TABLE videos
+	ADD INDEX videos_channel_published (channel_cid, published_date, vid),
+	ADD INDEX videos_published (published_date, vid);
+
+-- Only keep a single copy of each downloaded variant of a video.
+DELETE newer FROM downloaded_videos AS newer
+	INNER JOIN downloaded_videos AS older
+	ON older.vid = newer.vid AND older.height = newer.height
+		AND older.extension = newer.extension AND older.id < newer.id;
+
+ALTER TABLE downloaded_videos
+	ADD UNIQUE INDEX downloaded_videos_variant (vid, height, extension);
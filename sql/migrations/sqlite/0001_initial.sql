@@ -0,0 +1,40 @@
+-- 0001_initial.sql
+-- Creates the basic tables for our project on SQLite. Dates are stored as
+-- text in the local time, the same way MySQL stores them.
+
+CREATE TABLE channels(
+	cid			VARCHAR(30)		NOT NULL PRIMARY KEY,
+	name		VARCHAR(100)	NOT NULL UNIQUE,
+	description	TEXT			NULL
+);
+
+CREATE TABLE videos(
+	vid				VARCHAR(11)		NOT NULL PRIMARY KEY,
+	channel_cid		VARCHAR(30)		NOT NULL,
+	title			VARCHAR(255)	NOT NULL,
+	description		TEXT			NULL,
+	published_date	DATETIME		NOT NULL,
+	duration		INT				NULL,
+	width			SMALLINT		NULL,
+	height			SMALLINT		NULL,
+	fps				TINYINT			NULL,
+	chapters		TEXT			NULL,
+
+	FOREIGN KEY (channel_cid) REFERENCES channels (cid)
+		ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+CREATE INDEX videos_title ON videos (title);
+
+CREATE TABLE downloaded_videos(
+	id			INTEGER			NOT NULL PRIMARY KEY,
+	vid			VARCHAR(11)		NOT NULL,
+	width		SMALLINT		NOT NULL,
+	height		SMALLINT		NOT NULL,
+	fps			TINYINT			NOT NULL,
+	filesize	BIGINT			NULL,
+	extension	VARCHAR(4)		NOT NULL,
+
+	FOREIGN KEY (vid) REFERENCES videos (vid)
+		ON DELETE CASCADE ON UPDATE CASCADE
+);
@@ -0,0 +1,15 @@
+-- 0002_metadata_queue.sql
+-- Queue of the videos whose extra metadata still has to be fetched by the
+-- enrichment worker.
+
+CREATE TABLE metadata_queue(
+	vid			VARCHAR(11)		NOT NULL PRIMARY KEY,
+	queued_at	DATETIME		NOT NULL DEFAULT (datetime('now', 'localtime')),
+	attempts	TINYINT			NOT NULL DEFAULT 0,
+	last_error	TEXT			NULL,
+
+	FOREIGN KEY (vid) REFERENCES videos (vid)
+		ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+CREATE INDEX metadata_queue_attempts ON metadata_queue (attempts, queued_at);
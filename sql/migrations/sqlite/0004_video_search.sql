@@ -0,0 +1,28 @@
+-- 0004_video_search.sql
+-- Full-text index of the titles and descriptions that the searches rank the
+-- videos with, kept in sync with the videos by the triggers below.
+
+CREATE VIRTUAL TABLE videos_fts USING fts5(title, description,
+	content='videos', content_rowid='rowid',
+	tokenize='unicode61 remove_diacritics 2');
+
+CREATE TRIGGER videos_fts_insert AFTER INSERT ON videos BEGIN
+	INSERT INTO videos_fts(rowid, title, description)
+		VALUES (new.rowid, new.title, new.description);
+END;
+
+CREATE TRIGGER videos_fts_delete AFTER DELETE ON videos BEGIN
+	INSERT INTO videos_fts(videos_fts, rowid, title, description)
+		VALUES ('delete', old.rowid, old.title, old.description);
+END;
+
+CREATE TRIGGER videos_fts_update AFTER UPDATE OF title, description ON videos
+BEGIN
+	INSERT INTO videos_fts(videos_fts, rowid, title, description)
+		VALUES ('delete', old.rowid, old.title, old.description);
+	INSERT INTO videos_fts(rowid, title, description)
+		VALUES (new.rowid, new.title, new.description);
+END;
+
+-- Index the videos that are already there.
+INSERT INTO videos_fts(videos_fts) VALUES ('rebuild');
@@ -0,0 +1,33 @@
+-- 0005_download_jobs.sql
+-- Persistent queue of the downloads that the download workers process.
+
+CREATE TABLE download_jobs(
+	id					INTEGER			NOT NULL PRIMARY KEY,
+	vid					VARCHAR(11)		NOT NULL,
+	height				SMALLINT		NOT NULL,
+	state				VARCHAR(7)		NOT NULL DEFAULT 'queued'
+		CHECK (state IN ('queued', 'running', 'done', 'failed')),
+	attempts			TINYINT			NOT NULL DEFAULT 0,
+	next_attempt		DATETIME		NOT NULL DEFAULT (datetime('now', 'localtime')),
+	downloaded_bytes	BIGINT			NULL,
+	total_bytes			BIGINT			NULL,
+	speed				INT				NULL,
+	error				TEXT			NULL,
+	created_at			DATETIME		NOT NULL DEFAULT (datetime('now', 'localtime')),
+	updated_at			DATETIME		NOT NULL DEFAULT (datetime('now', 'localtime')),
+
+	UNIQUE (vid, height),
+
+	FOREIGN KEY (vid) REFERENCES videos (vid)
+		ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+CREATE INDEX download_jobs_state ON download_jobs (state, next_attempt);
+
+-- Stands in for MySQL's ON UPDATE CURRENT_TIMESTAMP.
+CREATE TRIGGER download_jobs_updated AFTER UPDATE ON download_jobs
+	WHEN new.updated_at = old.updated_at
+BEGIN
+	UPDATE download_jobs SET updated_at = datetime('now', 'localtime')
+		WHERE id = new.id;
+END;
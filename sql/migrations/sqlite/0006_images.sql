@@ -0,0 +1,15 @@
+-- 0006_images.sql
+-- Where the content-addressed thumbnails and avatars came from and where
+-- they are stored.
+
+CREATE TABLE images(
+	kind		VARCHAR(10)		NOT NULL
+		CHECK (kind IN ('thumbnails', 'avatars')),
+	owner		VARCHAR(30)		NOT NULL,
+	url			VARCHAR(512)	NOT NULL,
+	etag		VARCHAR(255)	NULL,
+	hash		CHAR(40)		NOT NULL,
+	extension	VARCHAR(4)		NOT NULL,
+
+	PRIMARY KEY (kind, owner)
+);
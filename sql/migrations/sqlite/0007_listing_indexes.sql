@@ -0,0 +1,13 @@
+-- 0007_listing_indexes.sql
+-- Indexes that match the way the listings are queried, so that pages are read
+-- straight from the index instead of sorting every row of a channel.
+
+-- Latest videos of a channel and of every channel, keyset paginated by
+-- (published_date, vid).
+CREATE INDEX videos_channel_published ON videos (channel_cid, published_date,
+	vid);
+CREATE INDEX videos_published ON videos (published_date, vid);
+
+-- Only keep a single copy of each downloaded variant of a video.
+CREATE UNIQUE INDEX downloaded_videos_variant ON downloaded_videos (vid,
+	height, extension);
@@ -0,0 +1,42 @@
+-- 0008_timeline.sql
+-- Newest videos of every channel with their channel and avatar joined in, so
+-- that the home feed is read from a small table no matter how big the archive
+-- gets. It's kept up to date as videos are saved and can be rebuilt with
+-- ./bin/rebuild_timeline.
+
+CREATE TABLE timeline(
+	vid					VARCHAR(11)		NOT NULL PRIMARY KEY,
+	channel_cid			VARCHAR(30)		NOT NULL,
+	title				VARCHAR(255)	NOT NULL,
+	description			TEXT			NULL,
+	published_date		DATETIME		NOT NULL,
+	duration			INT				NULL,
+	width				SMALLINT		NULL,
+	height				SMALLINT		NULL,
+	fps					TINYINT			NULL,
+	chapters			TEXT			NULL,
+	channel_name		VARCHAR(100)	NOT NULL,
+	channel_description	TEXT			NULL,
+	avatar_hash			CHAR(40)		NULL,
+	avatar_extension	VARCHAR(4)		NULL,
+
+	FOREIGN KEY (vid) REFERENCES videos (vid)
+		ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+CREATE INDEX timeline_published ON timeline (published_date, vid);
+CREATE INDEX timeline_channel ON timeline (channel_cid);
+
+INSERT INTO timeline(vid, channel_cid, title, description, published_date,
+		duration, width, height, fps, chapters, channel_name,
+		channel_description, avatar_hash, avatar_extension)
+	SELECT videos.vid, videos.channel_cid, videos.title, videos.description,
+		videos.published_date, videos.duration, videos.width, videos.height,
+		videos.fps, videos.chapters, channels.name, channels.description,
+		images.hash, images.extension
+	FROM videos
+	INNER JOIN channels ON channels.cid = videos.channel_cid
+	LEFT JOIN images ON images.kind = 'avatars'
+		AND images.owner = videos.channel_cid
+	ORDER BY videos.published_date DESC, videos.vid DESC
+	LIMIT 1000;
@@ -0,0 +1,37 @@
+-- 0009_changes.sql
+-- Log of the latest change to each channel, video and downloaded video, which
+-- lets mirrors sync only what changed since they last did. Every item only
+-- has a single entry, which is given a new sequence number whenever the item
+-- changes again, and deleted items are kept around as tombstones.
+
+CREATE TABLE changes(
+	kind		VARCHAR(17)		NOT NULL
+		CHECK (kind IN ('channels', 'videos', 'downloaded_videos')),
+	item		VARCHAR(30)		NOT NULL,
+	seq			BIGINT			NOT NULL,
+	deleted		BOOLEAN			NOT NULL DEFAULT FALSE,
+	changed_at	DATETIME		NOT NULL DEFAULT (datetime('now', 'localtime')),
+
+	PRIMARY KEY (kind, item)
+);
+
+CREATE INDEX changes_seq ON changes (seq);
+
+-- Hands out the sequence numbers of the log, so they're never reused.
+CREATE TABLE change_counter(
+	id			TINYINT			NOT NULL PRIMARY KEY,
+	seq			BIGINT			NOT NULL
+);
+
+-- Everything that's already there counts as a change, parents first.
+INSERT INTO changes(kind, item, seq)
+	SELECT 'channels', cid, ROW_NUMBER() OVER (ORDER BY cid) FROM channels;
+INSERT INTO changes(kind, item, seq)
+	SELECT 'videos', vid, (SELECT COUNT(*) FROM channels) +
+		ROW_NUMBER() OVER (ORDER BY published_date, vid) FROM videos;
+INSERT INTO changes(kind, item, seq)
+	SELECT 'downloaded_videos', id, (SELECT COUNT(*) FROM channels) +
+		(SELECT COUNT(*) FROM videos) + ROW_NUMBER() OVER (ORDER BY id)
+		FROM downloaded_videos;
+INSERT INTO change_counter(id, seq)
+	SELECT 1, COUNT(*) FROM changes;
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""Fixtures that give every test a database of its own."""
+
+import pytest
+
+from owntube.utils import cache, database
+from owntube.utils.commonutils import db_pool, db_release, read_config
+from owntube.utils.migrations import Migrator
+
+@pytest.fixture
+def config(tmp_path):
+    """Configuration of a project that keeps its SQLite database in a
+    temporary folder and doesn't cache anything."""
+    read_config.config = {
+        'db': { 'backend': 'sqlite', 'path': str(tmp_path / 'owntube.db') },
+        'settings': { 'video_count': 20 },
+        'cache': { 'backend': 'none' }
+    }
+    yield read_config.config
+
+    # Start from scratch in the next test.
+    db_release()
+    if hasattr(db_pool, 'pool'):
+        del db_pool.pool
+    if hasattr(cache.get_cache, 'cache'):
+        del cache.get_cache.cache
+    database._known_ids.clear()
+    del read_config.config
+
+@pytest.fixture
+def db(config):
+    """Connection pool of a database with every migration applied."""
+    Migrator().migrate()
+    return db_pool()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+import json
+
+import pytest
+
+from owntube.utils import dumpreader
+from owntube.utils.dumpreader import DumpReader
+
+# Channel of a dump with its videos, which ytdump writes as its last key.
+CHANNEL = { 'title': 'Channel A', 'resourceId': { 'channelId': 'UCa' },
+            'thumbnails': { 'default': { 'url': 'https://example.com/a' } } }
+VIDEOS = [{ 'title': f'Video {i} "quoted" [{i}]', 'position': i * 12345,
+            'resourceId': { 'videoId': f'v{i:010d}' } } for i in range(50)]
+
+@pytest.fixture(params=[3, 7, 65536])
+def chunk_size(request, monkeypatch):
+    """Reads the dumps in chunks that cut through their values."""
+    monkeypatch.setattr(dumpreader._JSONStream, 'CHUNK_SIZE', request.param)
+
+def test_json(tmp_path, chunk_size):
+    path = tmp_path / 'dump.json'
+    path.write_text(json.dumps(dict(CHANNEL, videos=VIDEOS), indent='\t'))
+
+    with DumpReader(str(path)) as dump:
+        assert dump.channel == CHANNEL
+        assert list(dump.videos) == VIDEOS
+
+def test_json_without_videos(tmp_path, chunk_size):
+    for videos in ([], None):
+        path = tmp_path / 'dump.json'
+        path.write_text(json.dumps(dict(CHANNEL, videos=videos)))
+
+        with DumpReader(str(path)) as dump:
+            assert dump.channel == CHANNEL
+            assert list(dump.videos) == []
+
+def test_jsonl(tmp_path):
+    path = tmp_path / 'dump.jsonl'
+    path.write_text('\n'.join(json.dumps(obj) for obj in [CHANNEL] + VIDEOS) +
+                    '\n\n')
+
+    with DumpReader(str(path)) as dump:
+        assert dump.channel == CHANNEL
+        assert list(dump.videos) == VIDEOS
+
+def test_truncated(tmp_path, chunk_size):
+    path = tmp_path / 'dump.json'
+    path.write_text(json.dumps(dict(CHANNEL, videos=VIDEOS))[:-100])
+
+    with pytest.raises(ValueError):
+        with DumpReader(str(path)) as dump:
+            list(dump.videos)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import socket
+import threading
+import time
+
+import pytest
+
+from owntube.exceptions import FetchError
+from owntube.utils.fetcher import FetchEngine
+
+class _Handler(BaseHTTPRequestHandler):
+    """Stands in for the servers that the engine fetches from."""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            hits = server.hits[self.path]
+
+        if self.path == '/flaky' and hits == 1:
+            self._respond(503, { 'Retry-After': '0.2' })
+        elif self.path == '/etag':
+            if self.headers.get('If-None-Match') == '"v1"':
+                self._respond(304)
+            else:
+                self._respond(200, { 'ETag': '"v1"' }, b'body')
+        elif self.path.startswith('/slow'):
+            with server.lock:
+                server.in_flight += 1
+                server.max_in_flight = max(server.max_in_flight,
+                                           server.in_flight)
+            time.sleep(0.2)
+            with server.lock:
+                server.in_flight -= 1
+            self._respond(200, body=b'slow')
+        else:
+            self._respond(200, body=b'ok')
+
+    def _respond(self, status, headers = {}, body = b''):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def server():
+    """Local HTTP server running in a thread of its own."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.lock = threading.Lock()
+    server.hits = {}
+    server.in_flight = 0
+    server.max_in_flight = 0
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,),
+                              daemon=True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def engine():
+    engine = FetchEngine(per_host=2, timeout=5, retries=2, backoff=0.01,
+                         http2=False)
+    yield engine
+    engine.close()
+
+def test_retries_after_server_error(server, engine):
+    start = time.monotonic()
+    resp = engine.fetch(f'{server.url}/flaky')
+
+    assert resp.status_code == 200
+    assert resp.content == b'ok'
+    assert server.hits['/flaky'] == 2
+
+    # It waited as long as the server asked for.
+    assert time.monotonic() - start >= 0.2
+
+def test_gives_up_retrying(server):
+    engine = FetchEngine(retries=0, http2=False)
+    try:
+        assert engine.fetch(f'{server.url}/flaky').status_code == 503
+    finally:
+        engine.close()
+
+def test_conditional_get(server, engine):
+    resp = engine.fetch(f'{server.url}/etag')
+    assert resp.status_code == 200
+
+    resp = engine.fetch(f'{server.url}/etag',
+                        { 'If-None-Match': resp.headers['ETag'] })
+    assert resp.status_code == 304
+    assert resp.content == b''
+
+def test_connection_failure(engine):
+    # Nothing listens on a port that was just given up.
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+
+    with pytest.raises(FetchError):
+        engine.fetch(f'http://127.0.0.1:{port}/')
+
+def test_timeout(server, engine):
+    with pytest.raises(FetchError):
+        engine.fetch(f'{server.url}/slow', timeout=0.05)
+
+def test_per_host_limit(server, engine):
+    results = engine.fetch_many([(f'{server.url}/slow/{i}', None)
+                                 for i in range(6)])
+
+    assert [resp.content for resp in results] == [b'slow'] * 6
+    assert server.max_in_flight == 2
+
+def test_fetch_many_keeps_errors(server, engine):
+    results = engine.fetch_many([(f'{server.url}/', None),
+                                 ('http://[invalid/', None)])
+
+    assert results[0].status_code == 200
+    assert isinstance(results[1], FetchError)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+from datetime import datetime, timedelta
+
+from owntube.channel import Channel
+from owntube.utils import migrations
+from owntube.utils.database import DatabaseItem
+from owntube.utils.migrations import MIGRATIONS_DIR, TABLES, Migrator, \
+    explain_listings, split_statements
+from owntube.video import Video
+
+def test_split_statements():
+    sql = '''-- A comment; with a semicolon.
+CREATE TABLE a(
+	id INT NOT NULL,
+	name TEXT
+);
+
+INSERT INTO a VALUES (1);
+CREATE TRIGGER a_trigger AFTER INSERT ON a
+BEGIN
+	UPDATE a SET id = 2;
+	UPDATE a SET id = 3;
+END;
+SELECT 1'''
+
+    assert split_statements(sql) == [
+        'CREATE TABLE a(\n\tid INT NOT NULL,\n\tname TEXT\n)',
+        'INSERT INTO a VALUES (1)',
+        'CREATE TRIGGER a_trigger AFTER INSERT ON a\nBEGIN\n'
+        '\tUPDATE a SET id = 2;\n\tUPDATE a SET id = 3;\nEND',
+        'SELECT 1'
+    ]
+
+def test_initial_migration_is_initialize_sql():
+    # Databases created with the old script are baselined at version 1.
+    with open(f'{MIGRATIONS_DIR}/0001_initial.sql', 'r') as fh:
+        statements = split_statements(fh.read())
+
+    # Its statements that pick the database are left to the configuration.
+    skipped = [stmt for stmt in statements
+               if migrations._DATABASE_REGEX.match(stmt) is not None]
+    assert skipped == statements[:2]
+    assert skipped[0].startswith('CREATE DATABASE')
+    assert skipped[1].startswith('USE')
+
+def test_backends_share_versions():
+    mysql = Migrator(MIGRATIONS_DIR, pool=_FakePool('mysql')).migrations()
+    sqlite = Migrator(pool=_FakePool('sqlite')).migrations()
+
+    assert [(v, name) for v, name, path in mysql] == \
+        [(v, name) for v, name, path in sqlite]
+    assert [v for v, name, path in mysql] == list(range(1, len(mysql) + 1))
+
+def test_migrate(db):
+    migrator = Migrator()
+    assert migrator.pending() == []
+    assert migrator.migrate() == []
+    assert migrator.applied() == set(range(1, len(migrator.migrations()) + 1))
+
+    # Every table worth copying must exist.
+    conn = db.acquire()
+    try:
+        with conn.cursor() as cur:
+            for table in TABLES:
+                cur.execute(f'SELECT COUNT(*) FROM {table}')
+                cur.fetchall()
+    finally:
+        db.release(conn)
+
+def test_migrate_up_to_target(config):
+    migrator = Migrator()
+    done = migrator.migrate(2)
+    assert [version for version, name in done] == [1, 2]
+    assert [m[0] for m in migrator.pending()][0] == 3
+
+    done = migrator.migrate()
+    assert done[0] == (3, 'feed_state')
+    assert migrator.pending() == []
+
+def test_baseline(config):
+    migrator = Migrator()
+    migrator.baseline(1)
+    migrator.baseline(1)
+    assert migrator.applied() == {1}
+    assert migrator.pending()[0][0] == 2
+
+def test_listings_use_indexes(db):
+    # A later change to a query or the schema mustn't lose the indexes.
+    for c in range(3):
+        channel = Channel(f'UC{c:022d}', f'Channel {c}', '')
+        channel.save()
+        DatabaseItem.save_many([
+            Video(channel, f'v{c}{i:09d}', f'Video {i}', '',
+                  datetime(2020, 1, 1) + timedelta(hours=i))
+            for i in range(100)])
+
+    assert explain_listings() == []
+
+class _FakePool:
+    """Stands in for a pool of a backend that is only asked for its
+    dialect."""
+
+    def __init__(self, name):
+        self.dialect = type('Dialect', (), { 'name': name })()
+
+    def acquire(self):
+        return None
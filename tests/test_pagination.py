@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+import base64
+
+import pytest
+
+from owntube.exceptions import InvalidCursor
+from owntube.utils.pagination import decode_cursor, encode_cursor, \
+    next_cursor
+
+def test_round_trip():
+    token = encode_cursor('2020-01-02 03:04:05', 'v0000000001')
+    assert decode_cursor(token, 2) == ['2020-01-02 03:04:05', 'v0000000001']
+    assert decode_cursor(None, 2) is None
+
+@pytest.mark.parametrize('token', [
+    'not base64!',
+    base64.urlsafe_b64encode(b'not json').decode('ascii'),
+    base64.urlsafe_b64encode(b'{"a": "b"}').decode('ascii'),
+    base64.urlsafe_b64encode(b'["a", 1]').decode('ascii'),
+    encode_cursor('a'),
+    'é'
+])
+def test_invalid(token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token, 2)
+
+def test_next_cursor():
+    items = [{ 'id': 'a' }, { 'id': 'b' }]
+    cursor = lambda item: encode_cursor(item['id'])
+
+    assert next_cursor(items, 2, cursor) == encode_cursor('b')
+    assert next_cursor(items, 3, cursor) is None
+    assert next_cursor(items, None, cursor) is None
+    assert next_cursor([], 0, cursor) is None
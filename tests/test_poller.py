@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+from datetime import datetime, timedelta, timezone
+from os.path import abspath, dirname
+
+from owntube.channel import Channel, YouTubeRSS
+from owntube.poller import new_entries, next_interval
+from owntube.video import Video
+
+# Feed of a channel that uploaded every other day.
+FEED = dirname(abspath(__file__)) + '/fixtures/feed.xml'
+
+# Polling intervals of the tests, in seconds.
+MIN_INTERVAL = 900
+MAX_INTERVAL = 86400
+
+def test_parse():
+    entries = _entries()
+
+    assert [entry['video_id'] for entry in entries] == \
+        ['v0000000003', 'v0000000002', 'v0000000001']
+    assert entries[0]['title'] == 'Third video'
+    assert entries[0]['description'] == 'The newest one & the best.'
+    assert entries[1]['description'] == ''
+    assert entries[0]['published'] == \
+        datetime(2023, 5, 5, 12, tzinfo=timezone.utc)
+    assert entries[2]['thumbnails'] == { 'default': {
+        'url': 'https://i3.ytimg.com/vi/v0000000001/hqdefault.jpg',
+        'width': 480,
+        'height': 360
+    } }
+
+def test_new_entries(db):
+    entries = _entries()
+    channel = Channel('UCa00000000000000000000a', 'Channel A', '')
+    channel.save()
+    oldest = entries[-1]
+    Video(channel, oldest['video_id'], oldest['title'],
+          oldest['description'], oldest['published']).save()
+
+    known = Video.existing_ids([entry['video_id'] for entry in entries])
+    assert [entry['video_id'] for entry in new_entries(entries, known)] == \
+        ['v0000000003', 'v0000000002']
+    assert new_entries(entries, { entry['video_id']
+                                  for entry in entries }) == []
+
+def test_interval_follows_uploads():
+    # Uploads two days apart get polled four times in between.
+    assert _interval(_entries(), MAX_INTERVAL, True) == 43200
+
+    # Busy channels are polled as often as allowed.
+    now = datetime(2023, 5, 1, tzinfo=timezone.utc)
+    busy = [{ 'published': now - timedelta(minutes=i) } for i in range(15)]
+    assert _interval(busy, MAX_INTERVAL, True) == MIN_INTERVAL
+
+    # Without a gap to go by there's no hurry.
+    assert _interval(_entries()[:1], MIN_INTERVAL, True) == MAX_INTERVAL
+    assert _interval([], MIN_INTERVAL, True) == MAX_INTERVAL
+
+def test_interval_backs_off():
+    interval = MIN_INTERVAL
+    intervals = []
+    for _ in range(12):
+        interval = _interval(_entries(), interval, False)
+        intervals.append(interval)
+
+    assert intervals[:3] == [1350, 2025, 3037]
+    assert intervals == sorted(intervals)
+    assert intervals[-1] == MAX_INTERVAL
+
+    # It speeds back up as soon as the feed changes again.
+    assert _interval(_entries(), interval, True) == 43200
+
+def _entries():
+    """Entries of the fixture feed."""
+    with open(FEED, 'rb') as fh:
+        return YouTubeRSS.parse(fh.read())
+
+def _interval(entries, interval, changed):
+    """Next polling interval with the intervals of the tests."""
+    return next_interval(entries, interval, changed, MIN_INTERVAL,
+                         MAX_INTERVAL)
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+
+from datetime import datetime
+
+from owntube.channel import Channel
+from owntube.search import InvertedIndex
+from owntube.utils.database import DatabaseItem
+from owntube.video import Video
+
+def test_index_skips_deleted_videos(db):
+    channel = Channel('UCa', 'Channel A', '')
+    channel.save()
+    DatabaseItem.save_many([
+        Video(channel, f'v{i:010d}', f'Python {"talk " * i}', '',
+              datetime(2020, 1, i + 1)) for i in range(5)])
+    index = InvertedIndex().build()
+
+    # Deleted videos stay in the index until it's rebuilt.
+    Video().from_id('v0000000000').delete()
+    Video().from_id('v0000000002').delete()
+
+    # Pages are still full, so clients know to ask for the next one.
+    page = index.search('python', 'natural', None, 2, None)
+    assert [vd.video_id for vd, score in page] == \
+        ['v0000000001', 'v0000000003']
+
+    vd, score = page[-1]
+    page = index.search('python', 'natural', None, 2,
+                        (repr(score), vd.video_id))
+    assert [vd.video_id for vd, score in page] == ['v0000000004']
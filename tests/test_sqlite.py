@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+from datetime import datetime
+
+from owntube.channel import Channel
+from owntube.search import VideoSearch
+from owntube.utils.commonutils import db_connect, open_pool
+from owntube.utils.database import DatabaseItem
+from owntube.utils.migrations import TABLES, Migrator, copy_database
+from owntube.utils.sqlite import _translate
+from owntube.video import Video
+
+def test_translate():
+    assert _translate("SELECT * FROM videos WHERE vid = %s AND "
+                      "title LIKE 'a%%'") == \
+        "SELECT * FROM videos WHERE vid = ? AND title LIKE 'a%'"
+
+def test_dates_come_back_as_datetimes(db):
+    _library()
+    video = Video().from_id('v0000000001')
+    assert video.published_date == datetime(2020, 1, 2)
+
+def test_dictionary_cursor(db):
+    _library()
+    with db_connect().cursor(dictionary=True) as cur:
+        cur.execute('SELECT cid, name FROM channels WHERE cid = %s', ['UCa'])
+        assert cur.fetchone() == { 'cid': 'UCa', 'name': 'Channel A' }
+
+def test_upsert(db):
+    channel = _library()
+    Channel('UCa', 'Renamed', 'Description').save()
+    DatabaseItem.save_many([
+        Video(channel, 'v0000000001', 'Edited', '', datetime(2020, 1, 2)),
+        Video(channel, 'v0000000009', 'New', '', datetime(2020, 1, 9))])
+
+    assert Channel().from_id('UCa').name == 'Renamed'
+    assert Video().from_id('v0000000001').title == 'Edited'
+    with db_connect().cursor() as cur:
+        cur.execute('SELECT COUNT(*) FROM videos')
+        assert cur.fetchone()[0] == 4
+
+def test_fts5_search(db):
+    channel = _library()
+    search = VideoSearch()
+    # The title that is nothing but the term ranks best.
+    assert _ids(search.search('python')) == ['v0000000002', 'v0000000001']
+    assert _ids(search.search('+python -snakes', mode='boolean')) == \
+        ['v0000000002']
+
+    # The index follows the videos through the triggers.
+    Video(channel, 'v0000000002', 'Rust', '', datetime(2020, 1, 3)).save()
+    assert _ids(search.search('python')) == ['v0000000001']
+    Video().from_id('v0000000001').delete()
+    assert search.search('python') == []
+
+def test_fts5_query():
+    assert VideoSearch._fts5_query('python snakes', 'natural') == \
+        '"python" OR "snakes"'
+    assert VideoSearch._fts5_query('+python -snakes', 'boolean') == \
+        '("python") NOT ("snakes")'
+    assert VideoSearch._fts5_query('', 'natural') is None
+
+def test_copy_database(db, tmp_path):
+    _library()
+    target = open_pool({ 'backend': 'sqlite',
+                         'path': str(tmp_path / 'copy.db') })
+    Migrator(pool=target).migrate()
+
+    copied = {}
+    copy_database(db, target, batch_size=2,
+                  progress=lambda table, count: copied.update({ table: count }))
+    assert copied == { 'channels': 1, 'videos': 3, 'timeline': 3,
+                       'changes': 4, 'change_counter': 1 }
+
+    # Copying again overwrites the rows instead of failing on them.
+    copy_database(db, target)
+    conn = target.acquire()
+    try:
+        with conn.cursor() as cur:
+            for table in TABLES:
+                cur.execute(f'SELECT COUNT(*) FROM {table}')
+                assert cur.fetchone()[0] == copied.get(table, 0)
+
+            # The search index is filled by the triggers.
+            cur.execute("SELECT COUNT(*) FROM videos_fts "
+                        "WHERE videos_fts MATCH 'python'")
+            assert cur.fetchone()[0] == 2
+    finally:
+        target.release(conn)
+
+def _library():
+    """Saves a channel with a few videos."""
+    channel = Channel('UCa', 'Channel A', 'Description')
+    channel.save()
+    DatabaseItem.save_many([
+        Video(channel, 'v0000000001', 'Python snakes', 'All about snakes',
+              datetime(2020, 1, 2)),
+        Video(channel, 'v0000000002', 'Python', 'The language',
+              datetime(2020, 1, 1)),
+        Video(channel, 'v0000000003', 'Rust', 'Another language',
+              datetime(2020, 1, 3))])
+
+    return channel
+
+def _ids(results):
+    """IDs of the videos found by a search."""
+    return [video.video_id for video, score in results]
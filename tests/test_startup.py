@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+
+from os.path import abspath, dirname
+import runpy
+
+# Benchmark that measures the imports in a fresh interpreter.
+bench = runpy.run_path(dirname(dirname(abspath(__file__))) +
+                       '/bin/bench_startup', run_name='bench_startup')
+
+# Longest that importing the web application may take, in milliseconds. It's
+# generous so that slow machines pass, but not an eager yt-dlp or Pillow.
+BUDGET_MS = 1000
+
+def test_app_startup():
+    # The first run may also have to compile the bytecode, so take the best.
+    best = min((bench['import_times']('app') for _ in range(3)),
+               key=lambda times: times['app'])
+
+    loaded = [name for name in bench['LAZY_MODULES'] if name in best]
+    assert loaded == []
+    assert best['app'] / 1000 < BUDGET_MS
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+from datetime import datetime
+
+from owntube.channel import Channel
+from owntube.sync import ChangeFeed
+from owntube.utils.database import DatabaseItem
+from owntube.video import DownloadedVideo, Video
+
+def test_everything_is_a_change(db):
+    channel, videos = _library()
+    batch = ChangeFeed().batch()
+
+    assert [c['id'] for c in batch['channels']] == ['UCa']
+    assert [v['id'] for v in batch['videos']] == \
+        [video.video_id for video in videos]
+    assert batch['videos'][0]['channel_id'] == 'UCa'
+    assert [d['video_id'] for d in batch['downloaded_videos']] == \
+        ['v0000000000']
+    assert batch['deleted'] == { 'channels': [], 'videos': [],
+                                 'downloaded_videos': [] }
+    assert batch['seq'] == 6
+    assert not batch['more']
+
+def test_batches(db):
+    _library()
+    feed = ChangeFeed()
+
+    seen = []
+    seq = 0
+    while True:
+        batch = feed.batch(seq, 2)
+        assert batch['seq'] > seq
+        seq = batch['seq']
+        seen += [v['id'] for v in batch['videos']]
+        if not batch['more']:
+            break
+
+    assert len(seen) == 4
+    assert feed.batch(seq) == feed.batch(seq, 1)
+    assert feed.batch(seq)['seq'] == seq
+
+def test_changes_move_to_the_end(db):
+    channel, videos = _library()
+    feed = ChangeFeed()
+    seq = feed.batch()['seq']
+
+    videos[1].title = 'Edited'
+    videos[1].save()
+    videos[1].save()
+    batch = feed.batch(seq)
+    assert [v['title'] for v in batch['videos']] == ['Edited']
+    assert batch['seq'] == seq + 2
+
+    # Each item only has a single entry in the log.
+    assert len(feed.batch()['videos']) == 4
+
+def test_tombstones(db):
+    channel, videos = _library()
+    feed = ChangeFeed()
+    seq = feed.batch()['seq']
+
+    videos[0].delete()
+    batch = feed.batch(seq)
+    assert batch['deleted'] == { 'channels': [], 'videos': ['v0000000000'],
+                                 'downloaded_videos': [1] }
+
+    # Deleting a channel takes everything in it along.
+    channel.delete()
+    batch = feed.batch(seq)
+    assert batch['deleted'] == {
+        'channels': ['UCa'],
+        'videos': ['v0000000000', 'v0000000001', 'v0000000002',
+                   'v0000000003'],
+        'downloaded_videos': [1]
+    }
+    assert batch['channels'] == batch['videos'] == []
+
+def test_deletes_forget_ids(db):
+    channel, videos = _library()
+    Video.warm_ids()
+    DownloadedVideo.warm_ids()
+    assert Video.existing_ids(['v0000000000']) == { 'v0000000000' }
+
+    channel.delete()
+    assert Video.existing_ids(['v0000000000']) == set()
+    assert DownloadedVideo.existing_ids([1]) == set()
+
+def _library():
+    """Saves a channel with a few videos and a download."""
+    channel = Channel('UCa', 'Channel A', 'Description')
+    channel.save()
+    videos = [Video(channel, f'v{i:010d}', f'Video {i}', '',
+                    datetime(2020, 1, i + 1)) for i in range(4)]
+    DatabaseItem.save_many(videos)
+    DownloadedVideo(None, videos[0], 640, 360, 30, 1000, 'mp4').save()
+
+    return channel, videos
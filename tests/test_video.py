@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from owntube.channel import Channel
+from owntube.utils import metrics
+from owntube.utils.database import DatabaseItem
+from owntube.video import Video
+
+@pytest.fixture
+def queries(monkeypatch):
+    """Statements executed on the database, as they are accounted for in the
+    metrics."""
+    executed = []
+    record_query = metrics.record_query
+    def record(stmt, elapsed):
+        executed.append(stmt)
+        record_query(stmt, elapsed)
+
+    monkeypatch.setattr(metrics, 'record_query', record)
+    return executed
+
+@pytest.mark.parametrize('count', [5, 40])
+def test_list_query_count(db, queries, count):
+    channels = [Channel(f'UC{c:022d}', f'Channel {c}', '') for c in range(4)]
+    DatabaseItem.save_many(channels)
+    DatabaseItem.save_many([
+        Video(channels[i % len(channels)], f'v{i:010d}', f'Video {i}', '',
+              datetime(2020, 1, 1) + timedelta(hours=i))
+        for i in range(count)])
+
+    del queries[:]
+    videos = Video().list(count=100)
+
+    # The channels are joined in rather than fetched for every video.
+    assert len(queries) == 1
+    assert len(videos) == count
+    assert [video.channel.name for video in videos[:4]] == \
+        [f'Channel {(count - 1 - i) % 4}' for i in range(4)]
+
+    # Videos of the same channel share it.
+    assert len({ id(video.channel) for video in videos }) == \
+        min(count, len(channels))